@@ -0,0 +1,414 @@
+"""基准测试
+
+用法：
+    python benchmark.py match [合成源行数，默认100000]      旧版嵌套循环匹配 vs 频道名索引匹配
+    python benchmark.py table [保存的列表页HTML，默认合成]  逐行locator提取 vs 单次page.evaluate提取（需本地Chromium）
+    python benchmark.py memory [每个源行数，默认100000]     多源合并后 列表元组 vs ChannelStore 的内存占用（tracemalloc）
+    python benchmark.py suite [--sizes 10000,100000] [--repeat 3] [--save] [--compare] [--baseline 路径] [--threshold 0.2]
+        热路径基准套件：在录制语料（benchmarks/corpora/下的live.m3u/live.txt/live_hn.txt快照）和合成源上分别测量
+        解析、匹配、IPv6排序、播放列表写出的耗时与峰值内存；--save保存为基线（默认benchmarks/baseline.json，随仓库提交），
+        --compare与基线对比（有退化时退出码为1，基线不存在时退出码为2）
+        基线中的耗时与生成它的机器相关：换机器或CI运行器后先在同一台机器上用基线提交的代码--save，再对比改动
+        （--sizes 10000,100000,1000000 加入百万行合成源，约需2分钟、峰值内存约1.5GB）
+"""
+import argparse
+import functools
+import http.server
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import OrderedDict
+
+import main
+
+
+def generate_synthetic_source(line_count, template_channels, seed=0, ipv6_ratio=0.0):
+    """生成TXT格式的合成源（约一半行命中模板频道，其余为随机频道名；ipv6_ratio比例的链接为IPv6地址）"""
+    rng = random.Random(seed)
+    template_names = [name for channel_list in template_channels.values() for name in channel_list]
+    categories = list(template_channels.keys()) + ["其他频道", "地方频道"]
+
+    lines = []
+    used_categories = set()
+    while len(lines) < line_count:
+        # 分类名重复出现时解析器会重置该分类（丢弃前面的记录），因此重复的分类加序号区分，保证行数与记录数成正比
+        category = rng.choice(categories)
+        if category in used_categories:
+            category = f"{category}{len(used_categories)}"
+        used_categories.add(category)
+        lines.append(f"{category},#genre#")
+        for _ in range(rng.randint(20, 200)):
+            if rng.random() < 0.5:
+                channel_name = rng.choice(template_names)
+            else:
+                channel_name = f"频道{rng.randint(1, 20000)}"
+            if ipv6_ratio and rng.random() < ipv6_ratio:
+                host = f"[240e:{rng.randint(0, 0xffff):x}:{rng.randint(0, 0xffff):x}::{rng.randint(1, 0xffff):x}]"
+            else:
+                host = f"{rng.randint(1, 223)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}"
+            lines.append(f"{channel_name},http://{host}:{rng.randint(1024, 65535)}/rtp/239.{rng.randint(0, 255)}.0.1:5140")
+    return lines[:line_count]
+
+
+def parse_synthetic_source(lines):
+    """用流式解析器把合成源解析成all_channels结构"""
+    all_channels = OrderedDict()
+    reset_category = lambda category: all_channels.__setitem__(category, [])
+    for category, channel_name, channel_url in main.iter_channel_records(lines, "synthetic.txt", reset_category):
+        all_channels.setdefault(category, []).append((channel_name, channel_url))
+    return all_channels
+
+
+def legacy_match_channels(template_channels, all_channels):
+    """旧版匹配实现（模板频道 × 在线分类 × 在线频道 嵌套循环），仅用于对比"""
+    matched_channels = OrderedDict()
+    for category, channel_list in template_channels.items():
+        matched_channels[category] = OrderedDict()
+        for channel_name in channel_list:
+            for online_category, online_channel_list in all_channels.items():
+                for online_channel_name, online_channel_url in online_channel_list:
+                    if channel_name == online_channel_name:
+                        matched_channels[category].setdefault(channel_name, []).append(online_channel_url)
+    return matched_channels
+
+
+def run_match_benchmark(line_count=100000, template_file="demo.txt"):
+    """对比两种匹配实现的耗时，并校验输出完全一致"""
+    template_channels = main.parse_template(template_file)
+    all_channels = parse_synthetic_source(generate_synthetic_source(line_count, template_channels))
+    record_count = sum(len(channel_list) for channel_list in all_channels.values())
+    print(f"合成源：{line_count}行，{record_count}条频道记录，模板频道{sum(map(len, template_channels.values()))}个")
+
+    start = time.perf_counter()
+    legacy_result = legacy_match_channels(template_channels, all_channels)
+    legacy_elapsed = time.perf_counter() - start
+
+    channel_store = main.ChannelStore.from_groups(all_channels.items())
+    start = time.perf_counter()
+    indexed_result = main.match_channels(template_channels, channel_store)
+    indexed_elapsed = time.perf_counter() - start
+
+    if legacy_result != indexed_result:
+        raise AssertionError("索引匹配结果与旧版嵌套循环结果不一致")
+
+    print(f"旧版嵌套循环匹配：{legacy_elapsed:.3f}秒")
+    print(f"频道名索引匹配：{indexed_elapsed:.3f}秒")
+    print(f"加速比：{legacy_elapsed / max(indexed_elapsed, 1e-9):.1f}x（输出一致）")
+
+
+def legacy_merge_sources(sources):
+    """旧版数据结构：每个源解析成 分类 → [(频道名, 链接)]，再按分类extend合并"""
+    all_channels = OrderedDict()
+    for lines in sources:
+        fetched_channels = OrderedDict()
+        reset_category = lambda category: fetched_channels.__setitem__(category, [])
+        for category, channel_name, channel_url in main.iter_channel_records(lines, "synthetic.txt", reset_category):
+            fetched_channels.setdefault(category, []).append((channel_name, channel_url))
+        for category, channel_list in fetched_channels.items():
+            channel_list = [item for item in channel_list if not main.is_url_blacklisted(item[1])]
+            all_channels.setdefault(category, []).extend(channel_list)
+    return all_channels
+
+
+def store_merge_sources(sources):
+    """ChannelStore：与fetch_all_channels相同，每个源解析进单独的ChannelStore后合并"""
+    all_channels = main.ChannelStore()
+    for lines in sources:
+        fetched_channels = main.ChannelStore()
+        for category, channel_name, channel_url in main.iter_channel_records(lines, "synthetic.txt",
+                                                                             fetched_channels.reset_category):
+            fetched_channels.append(category, channel_name, channel_url)
+        main.merge_channels(all_channels, fetched_channels)
+    return all_channels
+
+
+def measure_memory(build):
+    """返回 (构建结果, 结果常驻内存, 构建过程峰值内存)，单位字节"""
+    tracemalloc.start()
+    try:
+        baseline, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        result = build()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, current - baseline, peak - baseline
+
+
+def run_memory_benchmark(line_count=100000, source_count=4, template_file="demo.txt"):
+    """对比多源合并后两种数据结构的内存占用，并校验匹配结果一致"""
+    template_channels = main.parse_template(template_file)
+    sources = [generate_synthetic_source(line_count, template_channels, seed) for seed in range(source_count)]
+    print(f"合成源：{source_count}个 × {line_count}行")
+
+    legacy_channels, legacy_current, legacy_peak = measure_memory(lambda: legacy_merge_sources(sources))
+    store_channels, store_current, store_peak = measure_memory(lambda: store_merge_sources(sources))
+
+    legacy_result = main.match_channels(template_channels, main.ChannelStore.from_groups(legacy_channels.items()))
+    if legacy_result != main.match_channels(template_channels, store_channels):
+        raise AssertionError("ChannelStore的匹配结果与列表元组结构不一致")
+
+    mib = 1024 * 1024
+    print(f"合并后记录数：{store_channels.record_count()}")
+    print(f"列表元组：常驻 {legacy_current / mib:.1f}MiB，峰值 {legacy_peak / mib:.1f}MiB")
+    print(f"ChannelStore：常驻 {store_current / mib:.1f}MiB，峰值 {store_peak / mib:.1f}MiB")
+    print(f"常驻内存降低：{(1 - store_current / max(legacy_current, 1)) * 100:.0f}%（匹配结果一致）")
+
+
+# -------------------------- 热路径基准套件 --------------------------
+SUITE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks")
+# 录制语料使用固定快照而不是仓库根目录的输出文件（后者每次运行工作流都会被重新生成，导致前后测量的输入不同）
+SUITE_CORPORA_DIR = os.path.join(SUITE_DIR, "corpora")
+SUITE_RECORDED_CORPORA = ["live.m3u", "live.txt", "live_hn.txt"]
+SUITE_SYNTHETIC_SIZES = [10000, 100000]
+# 基线随仓库提交（更新方式：python benchmark.py suite --save）；耗时只在生成基线的同一台机器上可比，
+# 内存峰值与机器基本无关
+SUITE_BASELINE_FILE = os.path.join(SUITE_DIR, "baseline.json")
+# 耗时低于该值（秒）的变化视为计时噪声，不判为退化
+SUITE_TIME_NOISE_FLOOR = 0.002
+
+
+def load_suite_corpora(sizes, template_channels):
+    """返回 [(语料名, 行列表)]：benchmarks/corpora/下录制的输出快照 + 按行数缩放的合成源（含20% IPv6链接）"""
+    corpora = []
+    for file_name in SUITE_RECORDED_CORPORA:
+        corpus_file = os.path.join(SUITE_CORPORA_DIR, file_name)
+        if os.path.exists(corpus_file):
+            with open(corpus_file, "r", encoding="utf-8") as f:
+                corpora.append((file_name, f.read().splitlines()))
+        else:
+            print(f"跳过缺失的录制语料：{corpus_file}")
+    for line_count in sizes:
+        corpora.append((f"synthetic-{line_count}", generate_synthetic_source(line_count, template_channels, ipv6_ratio=0.2)))
+    return corpora
+
+
+def parse_corpus(lines, name):
+    """fetch_channels的解析部分：流式解析逐条写入ChannelStore"""
+    channels = main.ChannelStore()
+    for category, channel_name, channel_url in main.iter_channel_records(lines, name, channels.reset_category):
+        channels.append(category, channel_name, channel_url)
+    return channels
+
+
+def sort_matched_urls(matched_channels):
+    """build_playlist中按config.ip_version_priority对每个频道的链接做is_ipv6排序"""
+    prefer_ipv6 = main.config.ip_version_priority == "ipv6"
+    return [
+        sorted(urls, key=lambda url: not main.is_ipv6(url) if prefer_ipv6 else main.is_ipv6(url))
+        for channel_dict in matched_channels.values()
+        for urls in channel_dict.values()
+    ]
+
+
+def write_matched_channels(matched_channels, template_channels):
+    """updateChannelUrlsM3U：生成播放列表模型并按config.output_formats写出（不做台标联网检查）"""
+    # 每次调用写入新的临时目录：内容未变化时会跳过写文件，复用同一前缀会让重复测量只测到内容比较
+    with tempfile.TemporaryDirectory() as output_dir:
+        return main.updateChannelUrlsM3U(matched_channels, template_channels, os.path.join(output_dir, "live"))
+
+
+def measure_case(func, repeat):
+    """返回 {"seconds": repeat次中最短耗时, "peak_bytes": 单独一次tracemalloc运行的峰值内存}"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    _, _, peak = measure_memory(func)
+    return {"seconds": min(timings), "peak_bytes": peak}
+
+
+def run_suite(sizes=None, repeat=3, template_file="demo.txt"):
+    """在每个语料上依次测量 parse → match → sort → write，返回 {"语料名/阶段": 测量结果}"""
+    sizes = SUITE_SYNTHETIC_SIZES if sizes is None else sizes
+    template_channels = main.parse_template(template_file)
+    results = OrderedDict()
+
+    logo_check_enabled = main.config.logo_check_enabled
+    main.config.logo_check_enabled = False
+    try:
+        for corpus_name, lines in load_suite_corpora(sizes, template_channels):
+            channels = parse_corpus(lines, corpus_name)
+            matched_channels = main.match_channels(template_channels, channels)
+            cases = [
+                ("parse", lambda: parse_corpus(lines, corpus_name)),
+                ("match", lambda: main.match_channels(template_channels, channels)),
+                ("sort", lambda: sort_matched_urls(matched_channels)),
+                ("write", lambda: write_matched_channels(matched_channels, template_channels)),
+            ]
+            for case_name, func in cases:
+                key = f"{corpus_name}/{case_name}"
+                results[key] = measure_case(func, repeat)
+                print(f"{key:<32}{results[key]['seconds'] * 1000:>12.2f}ms"
+                      f"{results[key]['peak_bytes'] / 1024 / 1024:>12.2f}MiB")
+    finally:
+        main.config.logo_check_enabled = logo_check_enabled
+    return results
+
+
+def save_suite_baseline(results, baseline_file):
+    os.makedirs(os.path.dirname(baseline_file) or ".", exist_ok=True)
+    baseline = {
+        "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    with open(baseline_file, "w", encoding="utf-8") as f:
+        json.dump(baseline, f, ensure_ascii=False, indent=2)
+    print(f"基线已保存：{baseline_file}")
+
+
+def compare_suite_results(results, baseline_file, threshold=0.2):
+    """与基线逐项对比耗时和峰值内存，超过threshold比例（耗时还需超过噪声下限）的视为退化，返回退化项列表"""
+    with open(baseline_file, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    print(f"对比基线：{baseline_file}（{baseline['created_at']}，Python {baseline['python']}）")
+
+    regressions = []
+    for key, result in results.items():
+        base_result = baseline["results"].get(key)
+        if base_result is None:
+            print(f"{key:<32}基线中无此项")
+            continue
+        time_ratio = result["seconds"] / max(base_result["seconds"], 1e-9)
+        memory_ratio = result["peak_bytes"] / max(base_result["peak_bytes"], 1)
+        time_regressed = (time_ratio > 1 + threshold
+                          and result["seconds"] - base_result["seconds"] > SUITE_TIME_NOISE_FLOOR)
+        memory_regressed = memory_ratio > 1 + threshold
+        flags = [label for label, regressed in (("耗时退化", time_regressed), ("内存退化", memory_regressed)) if regressed]
+        print(f"{key:<32}耗时 {(time_ratio - 1) * 100:>+7.1f}%  峰值内存 {(memory_ratio - 1) * 100:>+7.1f}%  "
+              f"{'、'.join(flags)}")
+        if flags:
+            regressions.append(key)
+
+    if regressions:
+        print(f"发现{len(regressions)}项退化（阈值{threshold * 100:.0f}%）：{regressions}")
+    else:
+        print(f"无退化（阈值{threshold * 100:.0f}%）")
+    return regressions
+
+
+def run_suite_command(argv):
+    parser = argparse.ArgumentParser(prog="benchmark.py suite", description="热路径基准套件")
+    parser.add_argument("--sizes", default=",".join(map(str, SUITE_SYNTHETIC_SIZES)),
+                        help="合成源行数，逗号分隔（空字符串表示只用录制语料）")
+    parser.add_argument("--repeat", type=int, default=3, help="每项重复次数，取最短耗时")
+    parser.add_argument("--save", action="store_true", help="把本次结果保存为基线")
+    parser.add_argument("--compare", action="store_true", help="与基线对比，有退化时退出码为1")
+    parser.add_argument("--baseline", default=SUITE_BASELINE_FILE, help="基线文件路径")
+    parser.add_argument("--threshold", type=float, default=0.2, help="判为退化的增幅比例")
+    args = parser.parse_args(argv)
+
+    if args.compare and not os.path.exists(args.baseline):
+        print(f"基线文件不存在：{args.baseline}（先运行 python benchmark.py suite --save 生成并提交）")
+        return 2
+
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+    results = run_suite(sizes, args.repeat)
+    regressions = compare_suite_results(results, args.baseline, args.threshold) if args.compare else []
+    if args.save:
+        save_suite_baseline(results, args.baseline)
+    return 1 if regressions else 0
+
+
+def build_multicast_table_html(row_count=100, seed=0):
+    """生成与组播源列表页结构一致的合成页面（未保存真实页面时使用）"""
+    rng = random.Random(seed)
+    areas = ["海口", "澄迈", "吉阳", "儋州", "临高", "陵水", "三亚", "琼海"]
+    rows = []
+    for _ in range(row_count):
+        ip_address = f"{rng.randint(1, 223)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}"
+        status = "暂时失效" if rng.random() < 0.2 else "正常"
+        rows.append(
+            f'<tr><td data-label="IP:"><a class="ip-link" href="/?ip={ip_address}&p=hi">{ip_address}</a></td>'
+            f'<td data-label="状态:"><span class="status-badge">{status}</span></td>'
+            f'<td data-label="类型:">海南{rng.choice(areas)}电信</td></tr>'
+        )
+    return (
+        '<html><head><meta charset="utf-8"><title>组播源</title></head><body>'
+        '<section aria-label="组播源列表"><table class="iptv-table">'
+        '<thead><tr><th>IP</th><th>状态</th><th>类型</th></tr></thead>'
+        f'<tbody>{"".join(rows)}</tbody></table></section></body></html>'
+    )
+
+
+def legacy_extract_multicast_ips(page):
+    """旧版提取实现（每行3个locator，各自is_visible + inner_text），仅用于对比"""
+    multicast_ips = []
+    multicast_table = page.locator(main.MULTICAST_TABLE_SELECTOR)
+    multicast_table.wait_for(state="visible", timeout=30000)
+    for row in multicast_table.locator("tbody tr").all():
+        ip_link = row.locator('td[data-label="IP:"] a.ip-link')
+        ip_address = ip_link.inner_text().strip() if ip_link.is_visible() else None
+        status_badge = row.locator('td[data-label="状态:"] span.status-badge')
+        status = status_badge.inner_text().strip() if status_badge.is_visible() else None
+        type_cell = row.locator('td[data-label="类型:"]')
+        ip_type = type_cell.inner_text().strip() if type_cell.is_visible() else None
+        if ip_address:
+            multicast_ips.append({"ip_address": ip_address, "status": status, "type": ip_type})
+    return multicast_ips
+
+
+def run_table_extraction_benchmark(html_file=None, row_count=100):
+    """在本地HTTP服务上打开列表页，对比两种提取方式的耗时并校验结果一致"""
+    from playwright.sync_api import sync_playwright
+
+    with tempfile.TemporaryDirectory() as serve_dir:
+        with open(os.path.join(serve_dir, "index.html"), "w", encoding="utf-8") as f:
+            if html_file:
+                with open(html_file, "r", encoding="utf-8") as saved:
+                    f.write(saved.read())
+            else:
+                f.write(build_multicast_table_html(row_count))
+
+        handler = functools.partial(http.server.SimpleHTTPRequestHandler, directory=serve_dir)
+        handler.log_message = lambda *args: None
+        server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        page_url = f"http://127.0.0.1:{server.server_address[1]}/index.html"
+
+        try:
+            with sync_playwright() as p:
+                browser = p.chromium.launch(headless=True)
+                page = browser.new_page()
+                page.goto(page_url, wait_until="domcontentloaded")
+
+                start = time.perf_counter()
+                legacy_rows = legacy_extract_multicast_ips(page)
+                legacy_elapsed = time.perf_counter() - start
+
+                start = time.perf_counter()
+                bulk_rows = main.extract_multicast_ips_from_page(page)
+                bulk_elapsed = time.perf_counter() - start
+                browser.close()
+        finally:
+            server.shutdown()
+
+    keys = ("ip_address", "status", "type")
+    if [tuple(row[k] for k in keys) for row in legacy_rows] != [tuple(row[k] for k in keys) for row in bulk_rows]:
+        raise AssertionError("单次evaluate提取结果与逐行locator提取结果不一致")
+
+    print(f"列表页：{html_file or f'合成{row_count}行'}，有效IP {len(bulk_rows)}条")
+    print(f"逐行locator提取：{legacy_elapsed:.3f}秒")
+    print(f"单次page.evaluate提取：{bulk_elapsed:.3f}秒")
+    print(f"加速比：{legacy_elapsed / max(bulk_elapsed, 1e-9):.1f}x（结果一致）")
+
+
+if __name__ == "__main__":
+    benchmark_name = sys.argv[1] if len(sys.argv) >= 2 else "match"
+    if benchmark_name == "suite":
+        sys.exit(run_suite_command(sys.argv[2:]))
+    elif benchmark_name == "memory":
+        run_memory_benchmark(int(sys.argv[2]) if len(sys.argv) >= 3 else 100000)
+    elif benchmark_name == "table":
+        run_table_extraction_benchmark(sys.argv[2] if len(sys.argv) >= 3 else None)
+    else:
+        run_match_benchmark(int(sys.argv[2]) if len(sys.argv) >= 3 else 100000)
@@ -4,6 +4,100 @@ source_urls = [
     "http://iptv.cqshushu.com/?s=153.0.171.163%3A85&t=hotel&channels=1&format=txt"
 ]
 
+# 组播源站点首页（也用于Referer和验证Cookie的域名），及按真实ip:port生成频道列表链接的模板
+# 离线回放（python replay_server.py run）时会临时指向本地替身站点
+site_base_url = "https://iptv.cqshushu.com"
+multicast_channels_url = "http://iptv.cqshushu.com/?s={ip_port}&t=multicast&channels=1&format=txt"
+
+# 源链接并发抓取数（同时也是每个主机的keep-alive连接池大小）
+fetch_max_workers = 8
+
+# 批量模式（python main.py --batch）默认处理的省份，及并行进程数
+batch_provinces = ["海南", "湖南"]
+batch_max_workers = 2
+
+# 组播IP → 真实ip:port 解析缓存有效期（秒），及跳过浏览器阶段所需的最少有效条目数
+multicast_cache_ttl = 12 * 3600
+multicast_cache_min_entries = 2
+
+# 详情页解析方式："request" 用链接href直接请求详情页（复用Cookie，不渲染、不回退，失败再点击兜底），"click" 逐条点击进入
+multicast_detail_fetch_mode = "request"
+# 请求方式下同时在途的详情页请求数（也是每批解析的条数和兜底标签页数）
+multicast_detail_concurrency = 3
+# 按排名最多解析前N条组播IP的详情页
+multicast_detail_top_n = 6
+# 找到K个可TCP连接的ip:port后不再解析剩余候选（0表示解析全部前N条且不做连通性检查）
+# 默认0：开启后解析出的源列表会随运行时的连通性结果变化，源缓存每次都可能失效
+multicast_target_sources = 0
+# 连通性检查的TCP连接超时（秒）
+multicast_check_timeout = 3
+
+# 各省份组播IP的地区优先级（"类型"列包含的地区名越靠前越优先；未配置的省份保持页面顺序）
+area_priority = {
+    "海南": ["海口", "澄迈", "吉阳", "儋州", "临高", "陵水"],
+    "湖南": ["长沙", "株洲", "湘潭", "衡阳", "岳阳", "常德"],
+}
+# 选取前N条之前，对解析缓存中已知ip:port的IP做TCP建连测速，按耗时和历史连通记录重排
+multicast_latency_ranking = False
+
+# 浏览器池：同一进程内处理多个省份时复用一个常驻浏览器，每个省份只新建上下文，使用N次后重启浏览器
+browser_pool_enabled = True
+browser_pool_max_uses = 5
+# 外部常驻浏览器的CDP地址（如先启动 chrome --remote-debugging-port=9222 后填 "http://127.0.0.1:9222"），
+# 跨多次运行复用同一浏览器；为None时由本进程自行启动
+browser_cdp_endpoint = None
+
+# 运行缓存目录（工作流通过actions/cache跨运行保留，不提交到仓库）
+cache_dir = ".iptv_cache"
+
+# 源响应缓存总大小上限（字节），超出后按最近使用时间淘汰
+http_cache_max_bytes = 50 * 1024 * 1024
+# 源响应缓存默认有效期（秒）：有效期内直接复用不发请求，0表示每次都发条件请求校验
+http_cache_default_max_age = 0
+# 按源覆盖缓存有效期（秒），key为完整源链接或链接中的子串
+http_cache_max_age = {}
+
+# 频道名模糊匹配：按规范化名称（大小写、全半角、标点、清晰度标记、别名）匹配模板频道
+fuzzy_channel_match = True
+# 规范化时移除的清晰度标记（"4K"、"SD"在模板中区分不同频道，如CCTV4K/CCTV1SD，不能放在这里）
+channel_quality_tags = ["超高清", "高清", "超清", "FHD", "UHD", "HDR", "HD", "1080P", "720P", "HEVC", "H265"]
+# 台号后的描述（仅在紧跟数字或"+"时移除，如"CCTV1 综合"、"CCTV5+ 体育赛事"）
+channel_name_descriptors = [
+    "综合", "财经", "综艺", "中文国际", "体育", "体育赛事", "电影", "国防军事", "军事", "电视剧",
+    "纪录", "科教", "戏曲", "社会与法", "新闻", "少儿", "音乐", "农业农村", "奥林匹克"
+]
+# 频道别名表：别名 → 模板频道名（两侧都会先规范化）
+channel_aliases = {
+    "CCTV新闻": "CCTV13",
+    "CCTV少儿": "CCTV14",
+    "CGTN英语": "CGTN",
+    "中国教育1台": "CETV1",
+}
+
+# 线路探测：输出前实测每条链接（首字节耗时+吞吐量），剔除死链并按实测质量排序
+# 需要运行环境能访问各udpxy/HTTP源（境外runner访问国内组播源多数不通，默认关闭）
+probe_enabled = False
+# 探测全局并发上限
+probe_max_concurrency = 64
+# 单条探测超时（秒，含连接、首字节和读取数据）与建立连接超时（秒）
+probe_timeout = 6
+probe_connect_timeout = 3
+# 每条链接读取的数据量（字节），用于估算吞吐量
+probe_read_bytes = 256 * 1024
+# 最低吞吐量（字节/秒），低于该值视为不可用；0表示只要读到数据即可用
+probe_min_throughput = 0
+# 探测结果缓存有效期（秒）：可用链接在有效期内不重复探测
+probe_result_ttl = 6 * 3600
+# 不可用链接的重试退避（秒）：连续失败n次后等待 base * 2^(n-1)，最长不超过max
+probe_dead_retry_base = 3600
+probe_dead_retry_max = 7 * 24 * 3600
+# 主机级探测：按host:port分组，每台主机只做一次TCP检查并抽样探测，探测量随主机数而非链接数增长
+probe_host_mode = True
+# 每台主机抽样探测的链接数
+probe_host_sample_size = 3
+# 主机熔断后的处理："drop"剔除该主机全部链接，"deprioritize"保留但排到最后
+probe_host_breaker_action = "drop"
+
 url_blacklist = [
     "epdg.pw/stream/",
     "103.40.13.71:12390",
@@ -39,6 +133,21 @@ announcements = [
     }
 ]
 
+# 台标：tvg-logo地址模板；开启检查后每个台标地址只检查一次（按地址缓存logo_cache_ttl秒，更换模板后重新检查），不存在时用备用台标，未配置备用台标则省略
+logo_url_template = "https://gcore.jsdelivr.net/gh/yuanzl77/TVlogo@master/png/{channel_name}.png"
+# 默认关闭：开启后缓存过期的运行会向台标CDN发出约200个HEAD请求（与probe_enabled、epg_enabled一样按需开启）
+logo_check_enabled = False
+logo_check_workers = 16
+logo_check_timeout = 5
+logo_cache_ttl = 7 * 24 * 3600
+logo_fallback_url = None
+# 台标镜像：同时配置本地目录（如 "logos"，static.yml会一并发布）和其发布地址（如 https://<用户名>.github.io/<仓库名>/logos）时，把存在的台标下载到该目录随播放列表发布
+logo_mirror_dir = None
+logo_public_base_url = None
+
+# 输出格式（可选：m3u / txt / json，格式名后加 .gz 输出对应的gzip压缩版本，供Pages提供更小的下载）
+output_formats = ["m3u", "txt", "m3u.gz", "txt.gz"]
+
 epg_urls = [
     "https://live.fanmingming.com/e.xml",
     "http://epg.51zmt.top:8000/e.xml",
@@ -47,3 +156,11 @@ epg_urls = [
     "https://epg.pw/xmltv/epg_HK.xml",
     "https://epg.pw/xmltv/epg_TW.xml"
 ]
+
+# 合并节目单：流式下载epg_urls，只保留模板频道（按display-name匹配）的节目，合并输出为一个gzip压缩的XMLTV文件
+epg_enabled = False
+epg_output_file = "e.xml.gz"
+# 节目单存储（缓存目录下的SQLite）保留的时间窗口：结束时间早于 当前时间-该值 的节目被清理（秒）
+epg_keep_past = 24 * 3600
+# 合并节目单的公开地址（如 https://<用户名>.github.io/<仓库名>/e.xml.gz），设置后M3U头的x-tvg-url只引用它
+epg_public_url = None
@@ -1,22 +1,50 @@
 import re
 import requests
+import asyncio
 import logging
 import random
 import time
 import string
+import ssl
 import math
+import multiprocessing.util
 import os
 import sys
 import json
-from bs4 import BeautifulSoup
-from collections import OrderedDict
-from datetime import datetime
-from playwright.sync_api import sync_playwright, TimeoutError as PlaywrightTimeoutError
+import gzip
+import hashlib
+import io
+import itertools
+import threading
+import socket
+import sqlite3
+import unicodedata
+import zlib
+from array import array
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timezone
+from functools import lru_cache
+from urllib.parse import quote, urlsplit, urljoin
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape, quoteattr
+from requests.adapters import HTTPAdapter
 import config
 
+try:
+    import fcntl  # 仅POSIX提供，用于批量模式下多进程写回缓存索引时加文件锁
+except ImportError:
+    fcntl = None
+
+
 # -------------------------- 基础配置 --------------------------
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s',
-                    handlers=[logging.FileHandler("function.log", "w", encoding="utf-8"), logging.StreamHandler()])
+def setup_logging(log_file="function.log", mode="w"):
+    """配置日志输出到文件和控制台（由入口调用，导入模块时不产生副作用；已配置过时不重复配置）"""
+    if logging.getLogger().handlers:
+        # 已配置过时不再创建FileHandler（以"w"方式打开会截断正在写入的日志文件）
+        return
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s',
+                        handlers=[logging.FileHandler(log_file, mode, encoding="utf-8"), logging.StreamHandler()])
 
 # 省份名称 <-> value 映射字典
 PROVINCE_MAPPING = {
@@ -30,9 +58,6 @@ PROVINCE_MAPPING = {
 }
 VALUE_TO_PROVINCE = {v: k for k, v in PROVINCE_MAPPING.items()}
 
-# 地区优先级排序（按要求：海口、澄迈、吉阳、儋州、临高、陵水）
-AREA_PRIORITY = ["海口", "澄迈", "吉阳", "儋州", "临高", "陵水"]
-
 USER_AGENT_POOL = [
     "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/141.0.0.0 Safari/537.36",
     "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/140.0.0.0 Safari/537.36 Edg/140.0.0.0",
@@ -117,10 +142,6 @@ def init_clean_invalid_files():
                 logging.warning(f"清理异常文件：{file}")
 
 
-# 执行初始化清理
-init_clean_invalid_files()
-
-
 # -------------------------- 反爬工具函数 --------------------------
 def human_like_delay():
     """模拟人类思考延迟"""
@@ -226,6 +247,15 @@ def extract_verify_cookie_prefix(page):
         return "87eb4da0dd394d53"
 
 
+def get_site_cookie_domain():
+    """验证Cookie的域名：config.site_base_url的主域名（iptv.cqshushu.com → cqshushu.com；IP地址和两级域名原样使用）"""
+    hostname = urlsplit(config.site_base_url).hostname or ""
+    labels = hostname.split(".")
+    if len(labels) <= 2 or all(label.isdigit() for label in labels):
+        return hostname
+    return ".".join(labels[1:])
+
+
 def generate_human_like_verify_cookie(page):
     """生成带人类时序特征的验证Cookie（适配Cloudflare检测）"""
     try:
@@ -254,7 +284,7 @@ def generate_human_like_verify_cookie(page):
         page.context.add_cookies([{
             "name": "list_js_verified",
             "value": verify_token,
-            "domain": "cqshushu.com",  # 移除前缀点，避免跨域Cookie异常
+            "domain": get_site_cookie_domain(),  # 移除前缀点，避免跨域Cookie异常
             "path": "/",
             "expires": int(time.time()) + 1800,  # 30分钟，匹配网页默认
             "httpOnly": False,
@@ -262,7 +292,7 @@ def generate_human_like_verify_cookie(page):
             "sameSite": "None"  # 适配Cloudflare的SameSite策略
         }])
         # 强制刷新Cookie（确保生效）
-        page.evaluate(f'document.cookie = "list_js_verified={verify_token}; path=/; domain=cqshushu.com; max-age=1800"')
+        page.evaluate(f'document.cookie = "list_js_verified={verify_token}; path=/; domain={get_site_cookie_domain()}; max-age=1800"')
         logging.info(f"生成适配Cloudflare的验证Cookie：{verify_token}")
         return verify_token
     except Exception as e:
@@ -271,7 +301,7 @@ def generate_human_like_verify_cookie(page):
         page.context.add_cookies([{
             "name": "list_js_verified",
             "value": verify_token,
-            "domain": "cqshushu.com",
+            "domain": get_site_cookie_domain(),
             "path": "/",
             "expires": int(time.time()) + 1800,
             "httpOnly": False,
@@ -422,6 +452,8 @@ def inject_anti_detection_scripts(page):
 
 def handle_verification_page(page, home_url):
     """处理页面验证逻辑（适配Cloudflare，新增首页重入兜底）"""
+    from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
+
     max_verify_retry = 3
     verify_retry_count = 0
     verify_success = False
@@ -550,9 +582,15 @@ def randomize_storage_state(storage_path):
         logging.warning(f"随机化storage_state失败：{str(e)[:100]}")
 
 
-def check_storage_reuse_count(storage_path, max_reuse=1):
+def get_storage_files(storage_key=None):
+    """storage_state及其复用计数文件路径（批量模式按省份隔离，避免多进程争用同一文件）"""
+    if not storage_key:
+        return "iptv_storage_state.json", "storage_reuse_count.json"
+    return f"iptv_storage_state_{storage_key}.json", f"storage_reuse_count_{storage_key}.json"
+
+
+def check_storage_reuse_count(storage_path, max_reuse=1, count_file="storage_reuse_count.json"):
     """检查storage_state复用次数，达到阈值则删除（增加JSON解析容错）"""
-    count_file = "storage_reuse_count.json"
     count_data = {"count": 0}  # 默认值
 
     # 读取计数文件（增加容错）
@@ -591,43 +629,53 @@ def check_storage_reuse_count(storage_path, max_reuse=1):
 
 
 # -------------------------- IP处理核心函数 --------------------------
+# 组播源列表表格
+MULTICAST_TABLE_SELECTOR = 'section[aria-label="组播源列表"] table.iptv-table'
+MULTICAST_LINK_SELECTOR = 'td[data-label="IP:"] a.ip-link'
+
+# 在页面内一次性序列化整张表格（可见性判断与Playwright的is_visible一致：有尺寸且未隐藏）
+MULTICAST_TABLE_SCRIPT = """(table) => {
+    const isVisible = (el) => {
+        if (!el) return false;
+        const rect = el.getBoundingClientRect();
+        return rect.width > 0 && rect.height > 0 && getComputedStyle(el).visibility !== 'hidden';
+    };
+    const textOf = (el) => isVisible(el) ? el.innerText.trim() : null;
+    return Array.from(table.querySelectorAll('tbody tr')).map((row, rowIndex) => {
+        const link = row.querySelector('td[data-label="IP:"] a.ip-link');
+        return {
+            row_index: rowIndex,
+            ip_address: textOf(link),
+            status: textOf(row.querySelector('td[data-label="状态:"] span.status-badge')),
+            type: textOf(row.querySelector('td[data-label="类型:"]')),
+            href: link ? link.href : null
+        };
+    });
+}"""
+
+
 def extract_multicast_ips_from_page(page):
-    """从页面动态提取组播源IP信息"""
+    """从页面动态提取组播源IP信息（一次page.evaluate取回整张表格，避免逐行逐列的IPC往返）"""
+    from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
+
     multicast_ips = []
     try:
         # 等待表格加载（增加超时时间，支持重试）
-        multicast_table = page.locator('section[aria-label="组播源列表"] table.iptv-table')
+        multicast_table = page.locator(MULTICAST_TABLE_SELECTOR)
         multicast_table.wait_for(state="visible", timeout=30000)
 
-        # 获取表格所有行
-        ip_rows = multicast_table.locator("tbody tr").all()
-        logging.info(f"发现组播源IP总数：{len(ip_rows)}")
-
-        for row_idx, row in enumerate(ip_rows):
-            try:
-                # 提取IP地址
-                ip_link = row.locator('td[data-label="IP:"] a.ip-link')
-                ip_address = ip_link.inner_text().strip() if ip_link.is_visible() else None
-
-                # 提取状态
-                status_badge = row.locator('td[data-label="状态:"] span.status-badge')
-                status = status_badge.inner_text().strip() if status_badge.is_visible() else None
-
-                # 提取类型
-                type_cell = row.locator('td[data-label="类型:"]')
-                ip_type = type_cell.inner_text().strip() if type_cell.is_visible() else None
-
-                if ip_address:
-                    multicast_ips.append({
-                        "ip_address": ip_address,
-                        "status": status,
-                        "type": ip_type,
-                        "row_locator": row,
-                        "link_locator": ip_link
-                    })
-            except Exception as e:
-                logging.error(f"提取第{row_idx + 1}行IP信息失败：{str(e)[:100]}")
-                continue
+        rows = multicast_table.evaluate(MULTICAST_TABLE_SCRIPT)
+        logging.info(f"发现组播源IP总数：{len(rows)}")
+
+        for row in rows:
+            if row["ip_address"]:
+                multicast_ips.append({
+                    "ip_address": row["ip_address"],
+                    "status": row["status"],
+                    "type": row["type"],
+                    "href": row["href"],
+                    "row_index": row["row_index"]
+                })
     except PlaywrightTimeoutError:
         logging.error("组播源表格加载超时")
     except Exception as e:
@@ -635,8 +683,41 @@ def extract_multicast_ips_from_page(page):
     return multicast_ips
 
 
-def filter_and_sort_multicast_ips(ip_list):
-    """筛选并排序组播IP"""
+def get_multicast_link_locator(page, row_index):
+    """按行号构建IP链接定位器（只为实际需要点击的行构建）"""
+    return page.locator(MULTICAST_TABLE_SELECTOR).locator("tbody tr").nth(row_index).locator(MULTICAST_LINK_SELECTOR)
+
+
+def rank_multicast_ips_by_latency(sorted_ips, province_value):
+    """按TCP建连耗时和历史连通记录重排组播IP（只有解析缓存中有ip:port的IP能测量）
+
+    排序分三档：当前可连接的按（连续失败次数, 建连耗时）排，从未解析过的保持地区优先级顺序，
+    当前不可连接的按连续失败次数排在最后；同档内保持原有的地区优先级顺序。
+    """
+    cache = load_multicast_cache(province_value)
+    known_ip_ports = {ip["ip_address"]: cache[ip["ip_address"]]["ip_port"]
+                      for ip in sorted_ips if cache.get(ip["ip_address"], {}).get("ip_port")}
+    if not known_ip_ports:
+        return sorted_ips
+
+    latencies = check_ip_port_latencies(known_ip_ports.values())
+    logging.info(f"已测量{len(latencies)}个已知ip:port的TCP建连耗时")
+
+    def get_latency_rank(ip):
+        ip_port = known_ip_ports.get(ip["ip_address"])
+        if not ip_port:
+            return (1, 0, 0.0)
+        fail_count = cache[ip["ip_address"]].get("fail_count", 0)
+        latency = latencies.get(ip_port)
+        if latency is None:
+            return (2, fail_count, 0.0)
+        return (0, fail_count, latency)
+
+    return sorted(sorted_ips, key=get_latency_rank)
+
+
+def filter_and_sort_multicast_ips(ip_list, province_value="hi"):
+    """筛选并排序组播IP（地区优先级取自config.area_priority，可选按建连耗时重排）"""
     # 过滤失效IP
     filtered_ips = [ip for ip in ip_list if ip.get('status') != "暂时失效"]
     logging.info(f"筛选后有效组播IP数量：{len(filtered_ips)}（过滤掉{len(ip_list) - len(filtered_ips)}个暂时失效IP）")
@@ -646,18 +727,25 @@ def filter_and_sort_multicast_ips(ip_list):
         return []
 
     # 按地区优先级排序
+    area_priority = config.area_priority.get(VALUE_TO_PROVINCE.get(province_value), [])
+
     def get_area_priority(ip_type):
         if not ip_type:
-            return len(AREA_PRIORITY)
-        for idx, area in enumerate(AREA_PRIORITY):
+            return len(area_priority)
+        for idx, area in enumerate(area_priority):
             if area in ip_type:
                 return idx
-        return len(AREA_PRIORITY)
+        return len(area_priority)
 
     sorted_ips = sorted(filtered_ips, key=lambda x: get_area_priority(x.get('type')))
+    if config.multicast_latency_ranking:
+        sorted_ips = rank_multicast_ips_by_latency(sorted_ips, province_value)
 
     # 日志输出排序结果
-    logging.info("组播IP排序结果（按海口→澄迈→吉阳→儋州→临高→陵水）：")
+    order_desc = "→".join(area_priority) if area_priority else "页面顺序"
+    if config.multicast_latency_ranking:
+        order_desc += "，再按建连耗时和历史连通记录"
+    logging.info(f"组播IP排序结果（按{order_desc}）：")
     for i, ip in enumerate(sorted_ips[:5]):
         log_msg = f"   [{i + 1}] {ip['ip_address']} | 状态：{ip['status']} | 类型：{ip['type']}"
         logging.info(log_msg)
@@ -665,55 +753,456 @@ def filter_and_sort_multicast_ips(ip_list):
     return sorted_ips
 
 
+def parse_ip_port_from_html(page_html):
+    """从IP详情页HTML源代码中解析真实IP+端口（Title中的真实IP + Meta标签中的IP:端口）"""
+    if not page_html:
+        logging.warning("详情页HTML源代码为空")
+        return None
+
+    # 1. 正则提取Title中的真实IP（格式：IP详情: 103.48.232.250）
+    ip_pattern = r'IP详情:\s*((?:\d{1,3}\.){3}\d{1,3})'
+    ip_match = re.search(ip_pattern, page_html, re.IGNORECASE)
+    real_ip = ip_match.group(1) if ip_match else None
+
+    # 2. 正则提取Meta标签中的IP:端口（格式：103.48.232.250:4493）
+    ip_port_pattern = r'((?:\d{1,3}\.){3}\d{1,3}:\d+)'
+    ip_port_matches = re.findall(ip_port_pattern, page_html)
+    real_ip_port = None
+
+    # 过滤匹配结果：仅保留和真实IP一致的端口
+    if real_ip and ip_port_matches:
+        for item in ip_port_matches:
+            if item.startswith(real_ip):
+                real_ip_port = item
+                break
+    # 兜底：取第一个匹配的IP:端口（防止real_ip提取失败）
+    if not real_ip_port and ip_port_matches:
+        real_ip_port = ip_port_matches[0]
+
+    if real_ip_port:
+        logging.info(f"从Meta标签提取到真实IP+端口：{real_ip_port}")
+        return real_ip_port
+    elif real_ip:
+        logging.warning(f"仅提取到真实IP：{real_ip}，未找到端口")
+        return real_ip
+    else:
+        logging.warning("详情页Meta标签中未找到真实IP/端口")
+        return None
+
+
 def extract_ip_port_from_detail_page(page):
     """从IP详情页的Meta标签提取真实IP+端口（适配网站隐藏真实IP的策略）"""
     human_like_delay()
     try:
         page.wait_for_load_state("domcontentloaded", timeout=20000)
 
-        # 1. 获取页面完整HTML源代码（模拟人类查看源代码的逻辑）
-        page_html = page.content()
-        if not page_html:
-            logging.warning("详情页HTML源代码为空")
-            return None
-
-        # 2. 正则提取Title中的真实IP（格式：IP详情: 103.48.232.250）
-        ip_pattern = r'IP详情:\s*((?:\d{1,3}\.){3}\d{1,3})'
-        ip_match = re.search(ip_pattern, page_html, re.IGNORECASE)
-        real_ip = ip_match.group(1) if ip_match else None
-
-        # 3. 正则提取Meta标签中的IP:端口（格式：103.48.232.250:4493）
-        ip_port_pattern = r'((?:\d{1,3}\.){3}\d{1,3}:\d+)'
-        ip_port_matches = re.findall(ip_port_pattern, page_html)
-        real_ip_port = None
-
-        # 过滤匹配结果：仅保留和真实IP一致的端口
-        if real_ip and ip_port_matches:
-            for item in ip_port_matches:
-                if item.startswith(real_ip):
-                    real_ip_port = item
-                    break
-        # 兜底：取第一个匹配的IP:端口（防止real_ip提取失败）
-        if not real_ip_port and ip_port_matches:
-            real_ip_port = ip_port_matches[0]
-
-        if real_ip_port:
-            logging.info(f"从Meta标签提取到真实IP+端口：{real_ip_port}")
-            return real_ip_port
-        elif real_ip:
-            logging.warning(f"仅提取到真实IP：{real_ip}，未找到端口")
-            return real_ip
-        else:
-            logging.warning("详情页Meta标签中未找到真实IP/端口")
-            return None
+        # 获取页面完整HTML源代码（模拟人类查看源代码的逻辑）
+        return parse_ip_port_from_html(page.content())
 
     except Exception as e:
         logging.error(f"提取真实IP端口失败：{str(e)[:150]}")
         return None
 
 
-def get_province_multicast_ip_ports(province_input):
-    """获取指定省份的组播源IP及端口信息"""
+# 在列表页内并发fetch详情页HTML：请求与页面同源，自动携带验证后的Cookie，
+# 并用固定数量的worker限制同时在途的请求数；失败项返回null交给调用方兜底
+DETAIL_FETCH_SCRIPT = """async ({urls, concurrency}) => {
+    const results = new Array(urls.length).fill(null);
+    let next = 0;
+    const worker = async () => {
+        while (next < urls.length) {
+            const index = next++;
+            try {
+                const response = await fetch(urls[index], {credentials: "include"});
+                results[index] = response.ok ? await response.text() : null;
+            } catch (e) {
+                results[index] = null;
+            }
+        }
+    };
+    await Promise.all(Array.from({length: Math.max(1, Math.min(concurrency, urls.length))}, worker));
+    return results;
+}"""
+
+
+def is_detail_page_html(page_html):
+    """被验证页拦截时返回的不是详情页，不能用兜底正则乱取IP:端口"""
+    return bool(page_html) and "IP详情" in page_html
+
+
+def fetch_detail_pages(page, detail_urls):
+    """不渲染、不回退地获取多个详情页HTML：先在页面内并发fetch，失败的再用context.request逐个补取
+
+    sync API下Playwright调用只能在创建它的线程中进行，无法用线程池并发context.request，
+    因此并发放在浏览器侧（单次page.evaluate），context.request仅作为兜底。
+    """
+    html_list = [None] * len(detail_urls)
+    try:
+        html_list = page.evaluate(DETAIL_FETCH_SCRIPT, {
+            "urls": detail_urls,
+            "concurrency": config.multicast_detail_concurrency
+        })
+    except Exception as e:
+        logging.warning(f"页面内并发获取详情页失败：{str(e)[:150]}")
+
+    for index, detail_url in enumerate(detail_urls):
+        if html_list[index] is not None:
+            continue
+        try:
+            response = page.context.request.get(detail_url, timeout=20000)
+            if response.ok:
+                html_list[index] = response.text()
+            else:
+                logging.warning(f"详情页请求返回状态码{response.status}：{detail_url}")
+        except Exception as e:
+            logging.warning(f"详情页请求失败：{detail_url}，错误：{str(e)[:150]}")
+    return html_list
+
+
+def resolve_ip_ports_by_request(page, target_ips):
+    """通过链接href直接请求详情页并解析IP+端口，返回{组播IP: (IP+端口, 详情页URL)}（仅含解析成功的）"""
+    resolvable_ips = [ip for ip in target_ips if ip.get("href")]
+    detail_urls = [urljoin(page.url, ip["href"]) for ip in resolvable_ips]
+    if not detail_urls:
+        return {}
+
+    logging.info(f"请求方式并发获取{len(detail_urls)}个详情页（并发上限{config.multicast_detail_concurrency}）")
+    resolved = {}
+    for target_ip, detail_url, page_html in zip(resolvable_ips, detail_urls, fetch_detail_pages(page, detail_urls)):
+        if not is_detail_page_html(page_html):
+            logging.warning(f"未获取到有效详情页：{target_ip['ip_address']}")
+            continue
+        ip_port = parse_ip_port_from_html(page_html)
+        if ip_port:
+            resolved[target_ip["ip_address"]] = (ip_port, detail_url)
+    return resolved
+
+
+def resolve_ip_ports_by_tabs(page, target_ips):
+    """在同一上下文中开若干标签页并行加载详情页（会渲染，用于请求方式未拿到详情页的条目），返回格式同resolve_ip_ports_by_request"""
+    resolvable_ips = [ip for ip in target_ips if ip.get("href")]
+    resolved = {}
+    tab_count = max(1, config.multicast_detail_concurrency)
+    for batch_start in range(0, len(resolvable_ips), tab_count):
+        tabs = []
+        try:
+            for target_ip in resolvable_ips[batch_start:batch_start + tab_count]:
+                tab = page.context.new_page()
+                tabs.append((target_ip, tab))
+                try:
+                    # 收到响应头即返回，文档在各标签页中并行加载
+                    tab.goto(urljoin(page.url, target_ip["href"]), referer=page.url, wait_until="commit", timeout=20000)
+                except Exception as e:
+                    logging.warning(f"标签页打开详情页失败：{target_ip['ip_address']}，错误：{str(e)[:100]}")
+
+            for target_ip, tab in tabs:
+                try:
+                    tab.wait_for_load_state("domcontentloaded", timeout=20000)
+                    page_html = tab.content()
+                except Exception as e:
+                    logging.warning(f"标签页加载详情页失败：{target_ip['ip_address']}，错误：{str(e)[:100]}")
+                    continue
+                if not is_detail_page_html(page_html):
+                    logging.warning(f"标签页未获取到有效详情页：{target_ip['ip_address']}")
+                    continue
+                ip_port = parse_ip_port_from_html(page_html)
+                if ip_port:
+                    resolved[target_ip["ip_address"]] = (ip_port, tab.url)
+        finally:
+            for _, tab in tabs:
+                try:
+                    tab.close()
+                except Exception:
+                    pass
+    return resolved
+
+
+def make_ip_detail(rank, target_ip, ip_port, detail_url, resolved_at=None):
+    """组装单条组播IP的解析结果"""
+    ip_detail = {
+        "rank": rank,
+        "ip_address": target_ip["ip_address"],
+        "status": target_ip["status"],
+        "type": target_ip["type"],
+        "ip_port": ip_port,
+        "detail_url": detail_url
+    }
+    if resolved_at is not None:
+        ip_detail["resolved_at"] = resolved_at
+    return ip_detail
+
+
+def resolve_multicast_details(page, candidates, fresh_entries):
+    """按排名分批解析候选组播IP的ip:port，每批解析后检查TCP连通性，凑够可用源后提前结束"""
+    final_ip_details = []
+    working_count = 0
+    batch_size = max(1, config.multicast_detail_concurrency)
+    ranked_candidates = list(enumerate(candidates, 1))
+    on_detail_page = False
+
+    for batch_start in range(0, len(ranked_candidates), batch_size):
+        batch_details = []
+        pending_ips = []
+        for rank, target_ip in ranked_candidates[batch_start:batch_start + batch_size]:
+            # 解析缓存仍有效的IP无需进入详情页
+            cached_entry = fresh_entries.get(target_ip["ip_address"])
+            if cached_entry:
+                logging.info(f"第{rank}条IP命中解析缓存：{target_ip['ip_address']} → {cached_entry['ip_port']}")
+                batch_details.append(make_ip_detail(rank, target_ip, cached_entry["ip_port"],
+                                                    cached_entry["detail_url"], cached_entry["resolved_at"]))
+            else:
+                pending_ips.append((rank, target_ip))
+
+        if pending_ips and config.multicast_detail_fetch_mode == "request":
+            # 请求方式：直接用链接href获取详情页HTML，失败的再用标签页并行加载
+            target_ips = [target_ip for _, target_ip in pending_ips]
+            resolved = resolve_ip_ports_by_request(page, target_ips)
+            unresolved_ips = [target_ip for target_ip in target_ips if target_ip["ip_address"] not in resolved]
+            if unresolved_ips:
+                logging.warning(f"{len(unresolved_ips)}条IP请求方式解析失败，改为标签页并行加载")
+                resolved.update(resolve_ip_ports_by_tabs(page, unresolved_ips))
+            for rank, target_ip in pending_ips:
+                ip_port, detail_url = resolved.get(target_ip["ip_address"], (None, None))
+                batch_details.append(make_ip_detail(rank, target_ip, ip_port, detail_url))
+        else:
+            # 点击方式：逐条点击进入详情页，下一条点击前再返回列表页
+            for rank, target_ip in pending_ips:
+                try:
+                    if on_detail_page:
+                        page.go_back()
+                        human_like_delay()
+                        page.wait_for_load_state("domcontentloaded")
+                        page.locator(MULTICAST_TABLE_SELECTOR).wait_for(state="visible")
+                        on_detail_page = False
+
+                    logging.info(f"正在访问第{rank}条IP详情页：{target_ip['ip_address']}")
+
+                    # 模拟人类点击IP链接
+                    ip_link = get_multicast_link_locator(page, target_ip["row_index"])
+                    link_box = ip_link.bounding_box()
+                    if link_box:
+                        human_mouse_move(page,
+                                         random.randint(50, 100), random.randint(50, 100),
+                                         link_box["x"] + link_box["width"] / 2,
+                                         link_box["y"] + link_box["height"] / 2)
+                        human_like_delay()
+
+                    # 点击链接
+                    ip_link.click(delay=random.uniform(0.1, 0.3))
+                    on_detail_page = True
+                    human_like_delay()
+
+                    # 提取IP+端口
+                    ip_port = extract_ip_port_from_detail_page(page)
+                    batch_details.append(make_ip_detail(rank, target_ip, ip_port, page.url))
+
+                except Exception as e:
+                    logging.error(f"第{rank}条IP详情页抓取失败：{str(e)[:150]}")
+                    continue
+
+        final_ip_details.extend(batch_details)
+        if config.multicast_target_sources <= 0:
+            continue
+
+        # 检查本批ip:port的TCP连通性，凑够可用源即停止解析剩余候选
+        latencies = check_ip_port_latencies(ip_detail["ip_port"] for ip_detail in batch_details)
+        for ip_detail in batch_details:
+            if ip_detail["ip_port"]:
+                ip_detail["connect_latency"] = latencies.get(ip_detail["ip_port"])
+                if ip_detail["connect_latency"] is None:
+                    logging.warning(f"第{ip_detail['rank']}条IP的 {ip_detail['ip_port']} 无法连接")
+                else:
+                    working_count += 1
+        if working_count >= config.multicast_target_sources:
+            skipped_count = len(ranked_candidates) - batch_start - batch_size
+            if skipped_count > 0:
+                logging.info(f"已找到{working_count}个可用源，提前结束（跳过剩余{skipped_count}条候选）")
+            break
+
+    return final_ip_details
+
+
+# -------------------------- 组播源连通性检查 --------------------------
+def tcp_connect_latency(ip_port, timeout=None):
+    """TCP连接ip:port，返回建连耗时（秒），连接失败或没有端口时返回None"""
+    host, _, port = (ip_port or "").rpartition(":")
+    if not host or not port.isdigit():
+        return None
+    start = time.perf_counter()
+    try:
+        with socket.create_connection((host, int(port)), timeout=timeout or config.multicast_check_timeout):
+            return time.perf_counter() - start
+    except OSError:
+        return None
+
+
+def check_ip_port_latencies(ip_ports):
+    """并发检查多个ip:port的TCP连通性，返回{ip:port: 建连耗时或None}"""
+    ip_ports = list(dict.fromkeys(ip_port for ip_port in ip_ports if ip_port))
+    if not ip_ports:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(len(ip_ports), 16)) as executor:
+        return dict(zip(ip_ports, executor.map(tcp_connect_latency, ip_ports)))
+
+
+# -------------------------- 组播IP解析缓存 --------------------------
+def get_multicast_cache_path(province_value):
+    """组播IP → 真实ip:port 解析缓存文件（按省份分文件，批量模式各进程互不争用）"""
+    os.makedirs(config.cache_dir, exist_ok=True)
+    return os.path.join(config.cache_dir, f"multicast_ip_ports_{province_value}.json")
+
+
+def load_multicast_cache(province_value):
+    """读取省份的解析缓存（文件损坏时视为空）"""
+    cache_path = get_multicast_cache_path(province_value)
+    if not os.path.exists(cache_path):
+        return {}
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        logging.warning(f"组播IP解析缓存损坏，已忽略：{str(e)[:100]}")
+        return {}
+
+
+def get_fresh_multicast_entries(province_value):
+    """返回仍在有效期内且最近一次检查可连接的解析结果（按解析时的排名排序）"""
+    now = time.time()
+    entries = [
+        dict(entry, ip_address=ip_address) for ip_address, entry in load_multicast_cache(province_value).items()
+        if entry.get("ip_port") and now - entry.get("resolved_at", 0) < config.multicast_cache_ttl
+        and not entry.get("fail_count")
+    ]
+    return sorted(entries, key=lambda entry: entry.get("rank", 0))
+
+
+def update_multicast_cache(province_value, ip_details):
+    """写入本次解析到的ip:port（未解析出端口的不缓存），并按连通性检查结果累计连续失败次数"""
+    cache = load_multicast_cache(province_value)
+    now = time.time()
+    for item in ip_details:
+        if not item.get("ip_port"):
+            continue
+        previous_entry = cache.get(item["ip_address"], {})
+        fail_count = previous_entry.get("fail_count", 0)
+        if "connect_latency" in item:
+            fail_count = 0 if item["connect_latency"] is not None else fail_count + 1
+        cache[item["ip_address"]] = {
+            "rank": item.get("rank"),
+            "status": item.get("status"),
+            "type": item.get("type"),
+            "ip_port": item["ip_port"],
+            "detail_url": item.get("detail_url"),
+            "resolved_at": item.get("resolved_at", now),
+            "connect_latency": item.get("connect_latency", previous_entry.get("connect_latency")),
+            "fail_count": fail_count
+        }
+    cache_path = get_multicast_cache_path(province_value)
+    try:
+        with open(cache_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(cache, f, indent=2, ensure_ascii=False)
+        os.replace(cache_path + ".tmp", cache_path)
+    except Exception as e:
+        logging.error(f"写入组播IP解析缓存失败：{str(e)[:100]}")
+
+
+# -------------------------- 浏览器池 --------------------------
+_browser_pool = {"playwright": None, "browser": None, "uses": 0}
+
+
+def launch_stealth_browser(playwright):
+    """启动带反检测参数的浏览器；配置了config.browser_cdp_endpoint时改为连接外部常驻浏览器"""
+    if config.browser_cdp_endpoint:
+        logging.info(f"连接常驻浏览器：{config.browser_cdp_endpoint}")
+        return playwright.chromium.connect_over_cdp(config.browser_cdp_endpoint)
+
+    random_width, random_height = random.choice(WINDOW_SIZE_POOL)
+
+    # 启动浏览器（增强反检测参数）
+    chrome_args = ANTI_DETECTION_CONFIG["chrome_args"].copy()
+    chrome_args.append(f"--window-size={random_width},{random_height}")
+
+    # 新增Cloudflare反检测参数
+    chrome_args.extend([
+        "--disable-features=UserAgentClientHint",  # 禁用UA客户端提示（Cloudflare重点检测）
+        "--enable-features=NetworkService,NetworkServiceInProcess",
+        "--force-color-profile=srgb",  # 统一颜色配置，避免指纹差异
+        "--lang=zh-CN,zh",  # 强制语言，匹配国内访问特征
+        "--disable-background-timer-throttling",  # 禁用后台定时器节流
+        "--disable-renderer-throttling",  # 禁用渲染节流
+        "--no-zygote",  # 禁用zygote进程，减少特征
+    ])
+
+    return playwright.chromium.launch(
+        headless=True,  # 生产环境先保持False，排查通过后再改为True
+        args=chrome_args,
+        ignore_default_args=ANTI_DETECTION_CONFIG["ignore_default_args"],
+        slow_mo=random.uniform(100, 200),  # 放慢操作速度（从50-150提升到100-200）
+        channel="chrome"  # 指定原生Chrome通道，避免Chromium默认特征
+    )
+
+
+def acquire_browser():
+    """获取浏览器：开启浏览器池时复用常驻实例（每个省份只新建上下文，达到复用次数后重启），否则每次新启动"""
+    # Playwright导入较重，只在确实需要浏览器时才导入（静态源模式不会走到这里）
+    from playwright.sync_api import sync_playwright
+
+    if not config.browser_pool_enabled:
+        playwright = sync_playwright().start()
+        try:
+            return playwright, launch_stealth_browser(playwright)
+        except Exception:
+            playwright.stop()
+            raise
+
+    pool = _browser_pool
+    if pool["browser"] is not None and (pool["uses"] >= config.browser_pool_max_uses
+                                        or not pool["browser"].is_connected()):
+        logging.info(f"浏览器池实例已使用{pool['uses']}次，重启浏览器")
+        close_browser_pool()
+    if pool["browser"] is None:
+        pool["playwright"] = sync_playwright().start()
+        try:
+            pool["browser"] = launch_stealth_browser(pool["playwright"])
+        except Exception:
+            close_browser_pool()
+            raise
+        pool["uses"] = 0
+        logging.info("浏览器池已启动常驻浏览器")
+    pool["uses"] += 1
+    return pool["playwright"], pool["browser"]
+
+
+def release_browser(playwright, browser):
+    """归还浏览器：池中的常驻实例保留，非池化实例直接关闭"""
+    if config.browser_pool_enabled and browser is _browser_pool["browser"]:
+        return
+    try:
+        browser.close()
+        logging.info("浏览器已关闭")
+    finally:
+        playwright.stop()
+
+
+def close_browser_pool():
+    """关闭浏览器池中的常驻实例"""
+    pool = _browser_pool
+    try:
+        if pool["browser"] is not None:
+            pool["browser"].close()
+            logging.info("浏览器池实例已关闭")
+    except Exception as e:
+        logging.warning(f"关闭浏览器池实例失败：{str(e)[:100]}")
+    finally:
+        if pool["playwright"] is not None:
+            pool["playwright"].stop()
+        pool.update(playwright=None, browser=None, uses=0)
+
+
+def get_province_multicast_ip_ports(province_input, storage_key=None):
+    """获取指定省份的组播源IP及端口信息（storage_key用于隔离各省份的storage_state文件）"""
+    from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
+
     # 1. 校验省份参数
     try:
         province_value, province_name = validate_province(province_input)
@@ -721,42 +1210,20 @@ def get_province_multicast_ip_ports(province_input):
         logging.error(f"参数校验失败：{e}")
         return None
 
-    storage_path = "iptv_storage_state.json"
+    storage_path, count_file = get_storage_files(storage_key)
     final_ip_details = []
     start_time = time.time()
 
-    with sync_playwright() as p:
+    playwright, browser = acquire_browser()
+    try:
         # 随机选择基础配置
         random_ua = random.choice(USER_AGENT_POOL)
         random_width, random_height = random.choice(WINDOW_SIZE_POOL)
         random_color_scheme = random.choice(["light", "dark"])
         random_device_scale = random.choice([1.0, 1.25, 1.5])
 
-        # 启动浏览器（增强反检测参数）
-        chrome_args = ANTI_DETECTION_CONFIG["chrome_args"].copy()
-        chrome_args.append(f"--window-size={random_width},{random_height}")
-
-        # 新增Cloudflare反检测参数
-        chrome_args.extend([
-            "--disable-features=UserAgentClientHint",  # 禁用UA客户端提示（Cloudflare重点检测）
-            "--enable-features=NetworkService,NetworkServiceInProcess",
-            "--force-color-profile=srgb",  # 统一颜色配置，避免指纹差异
-            "--lang=zh-CN,zh",  # 强制语言，匹配国内访问特征
-            "--disable-background-timer-throttling",  # 禁用后台定时器节流
-            "--disable-renderer-throttling",  # 禁用渲染节流
-            "--no-zygote",  # 禁用zygote进程，减少特征
-        ])
-
-        browser = p.chromium.launch(
-            headless=True,  # 生产环境先保持False，排查通过后再改为True
-            args=chrome_args,
-            ignore_default_args=ANTI_DETECTION_CONFIG["ignore_default_args"],
-            slow_mo=random.uniform(100, 200),  # 放慢操作速度（从50-150提升到100-200）
-            channel="chrome"  # 指定原生Chrome通道，避免Chromium默认特征
-        )
-
         # 检查并处理storage_state复用次数
-        check_storage_reuse_count(storage_path, max_reuse=3)  # 最多复用3次
+        check_storage_reuse_count(storage_path, max_reuse=3, count_file=count_file)  # 最多复用3次
 
         # 随机化改造storage_state（若存在且有效）
         if os.path.exists(storage_path):
@@ -802,7 +1269,7 @@ def get_province_multicast_ip_ports(province_input):
                 "Upgrade-Insecure-Requests": "1",
                 "DNT": "1" if random.choice([True, False]) else "0",
                 f"X-Random-{generate_random_string()}": generate_random_string(16),
-                "Referer": random.choice(["", "https://iptv.cqshushu.com"])
+                "Referer": random.choice(["", config.site_base_url])
             },
             geolocation=generate_province_random_geo(province_value),  # 按省份生成随机经纬度
             permissions=["geolocation"]
@@ -816,7 +1283,7 @@ def get_province_multicast_ip_ports(province_input):
                 route.abort()
             else:
                 headers = request.headers.copy()
-                headers["Referer"] = random.choice(["", "https://iptv.cqshushu.com"])
+                headers["Referer"] = random.choice(["", config.site_base_url])
                 route.continue_(headers=headers)
 
         context.route("**/*", handle_route)
@@ -829,7 +1296,7 @@ def get_province_multicast_ip_ports(province_input):
             logging.info(f"开始抓取 {province_name} 的组播源IP信息，User-Agent: {random_ua[:50]}...")
 
             # 访问首页并处理验证
-            home_url = "https://iptv.cqshushu.com"
+            home_url = config.site_base_url
             max_retry_goto = 2
             retry_goto_count = 0
             page_loaded = False
@@ -934,67 +1401,31 @@ def get_province_multicast_ip_ports(province_input):
                 return None
 
             # 筛选并排序IP
-            sorted_ips = filter_and_sort_multicast_ips(multicast_ips)
+            sorted_ips = filter_and_sort_multicast_ips(multicast_ips, province_value)
             if not sorted_ips:
                 return None
 
-            # 处理前两条IP
-            target_ips = sorted_ips[:2]
-            logging.info(f"选择前{len(target_ips)}条有效组播IP进入详情页")
+            # 按排名取前N条候选IP解析详情页
+            target_ips = sorted_ips[:config.multicast_detail_top_n]
+            if config.multicast_target_sources > 0:
+                logging.info(f"选择前{len(target_ips)}条有效组播IP作为候选，凑够{config.multicast_target_sources}个可用源即停止")
+            else:
+                logging.info(f"选择前{len(target_ips)}条有效组播IP作为候选，全部解析")
             for i, ip in enumerate(target_ips):
                 log_msg = f"   [{i + 1}] {ip['ip_address']} | 类型：{ip['type']} | 状态：{ip['status']}"
                 logging.info(log_msg)
 
-            for idx, target_ip in enumerate(target_ips):
-                try:
-                    logging.info(f"正在访问第{idx + 1}条IP详情页：{target_ip['ip_address']}")
-
-                    # 模拟人类点击IP链接
-                    ip_link = target_ip["link_locator"]
-                    link_box = ip_link.bounding_box()
-                    if link_box:
-                        human_mouse_move(page,
-                                         random.randint(50, 100), random.randint(50, 100),
-                                         link_box["x"] + link_box["width"] / 2,
-                                         link_box["y"] + link_box["height"] / 2)
-                        human_like_delay()
-
-                    # 点击链接
-                    ip_link.click(delay=random.uniform(0.1, 0.3))
-                    human_like_delay()
-
-                    # 提取IP+端口
-                    ip_port = extract_ip_port_from_detail_page(page)
-
-                    # 保存结果
-                    final_ip_details.append({
-                        "rank": idx + 1,
-                        "ip_address": target_ip["ip_address"],
-                        "status": target_ip["status"],
-                        "type": target_ip["type"],
-                        "ip_port": ip_port,
-                        "detail_url": page.url
-                    })
-
-                    # 返回列表页（最后一条无需返回）
-                    if idx < len(target_ips) - 1:
-                        page.go_back()
-                        human_like_delay()
-                        page.wait_for_load_state("domcontentloaded")
-                        page.locator('section[aria-label="组播源列表"] table.iptv-table').wait_for(state="visible")
-
-                except Exception as e:
-                    logging.error(f"第{idx + 1}条IP详情页抓取失败：{str(e)[:150]}")
-                    continue
+            fresh_entries = {entry["ip_address"]: entry for entry in get_fresh_multicast_entries(province_value)}
+            final_ip_details = resolve_multicast_details(page, target_ips, fresh_entries)
 
         except json.JSONDecodeError as e:
             logging.error(f"JSON解析失败：{e}，重置storage_state后重试")
             # 重置相关文件后重试（可选）
-            if os.path.exists("iptv_storage_state.json"):
-                os.remove("iptv_storage_state.json")
-            if os.path.exists("storage_reuse_count.json"):
-                os.remove("storage_reuse_count.json")
-            return get_province_multicast_ip_ports(province_input)  # 重试一次
+            if os.path.exists(storage_path):
+                os.remove(storage_path)
+            if os.path.exists(count_file):
+                os.remove(count_file)
+            return get_province_multicast_ip_ports(province_input, storage_key)  # 重试一次
         except Exception as e:
             logging.error(f"核心逻辑出错：{str(e)[:200]}")
             try:
@@ -1006,14 +1437,13 @@ def get_province_multicast_ip_ports(province_input):
             # 持久化缓存
             if 'context' in locals():
                 context.storage_state(path=storage_path)
-            # 关闭浏览器
-            if 'browser' in locals():
                 context.close()
-                browser.close()
-                logging.info("浏览器已关闭")
 
         logging.info(f"抓取完成，总耗时：{time.time() - start_time:.2f}秒")
         return final_ip_details
+    finally:
+        # 关闭浏览器（浏览器池模式下保留常驻实例）
+        release_browser(playwright, browser)
 
 
 # -------------------------- 保留功能函数 --------------------------
@@ -1035,17 +1465,29 @@ def display_basic_info(ip_details):
         logging.info("-" * 50)
 
 
-def get_all_source_urls(province_input="海南"):
-    """获取所有待爬取的链接"""
+def get_all_source_urls(province_input="海南", storage_key=None):
+    """获取所有待爬取的链接（解析缓存中有效条目足够时不启动浏览器）"""
     # 获取IP+端口信息
-    ip_details = get_province_multicast_ip_ports(province_input)
+    try:
+        province_value, province_name = validate_province(province_input)
+        cached_details = get_fresh_multicast_entries(province_value)
+    except ValueError:
+        cached_details = []
+
+    if cached_details and len(cached_details) >= config.multicast_cache_min_entries:
+        logging.info(f"{province_name} 的组播IP解析缓存有效（{len(cached_details)}条），跳过浏览器阶段")
+        ip_details = cached_details
+    else:
+        ip_details = get_province_multicast_ip_ports(province_input, storage_key)
+        if ip_details:
+            update_multicast_cache(province_value, ip_details)
 
     # 展示原始IP信息
     display_basic_info(ip_details)
 
     # 生成动态链接
     dynamic_links = []
-    base_url = "http://iptv.cqshushu.com/?s={ip_port}&t=multicast&channels=1&format=txt"
+    base_url = config.multicast_channels_url
 
     if ip_details:
         for ip_item in ip_details:
@@ -1089,9 +1531,460 @@ def parse_template(template_file):
     return template_channels
 
 
+_http_session = None
+_http_session_lock = threading.Lock()
+
+
+def get_http_session():
+    """获取共享HTTP会话（按主机复用keep-alive连接池，避免每个源重复握手）"""
+    global _http_session
+    if _http_session is None:
+        with _http_session_lock:
+            if _http_session is None:
+                pool_size = max(1, config.fetch_max_workers)
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _http_session = session
+    return _http_session
+
+
+# -------------------------- 紧凑频道存储 --------------------------
+class ChannelStore:
+    """紧凑的在线频道记录存储，替代 OrderedDict[分类, list[(频道名, 链接)]]
+
+    分类名、频道名和链接后缀（$及之后的部分）各只保存一份，记录里只存编号；链接主体按UTF-8追加到一块缓冲区，
+    记录只存偏移和长度。每个分类的记录存为几列并行的array，遍历顺序与原来按分类extend合并的顺序一致。
+    为兼容原有代码，也支持按分类读取（keys/values/items/[]，读取时才生成元组列表）。
+    """
+    __slots__ = ("_strings", "_string_ids", "_records", "_url_buffer")
+
+    def __init__(self):
+        self._strings = []
+        self._string_ids = {}
+        # 分类名 → (频道名编号, 链接偏移, 链接长度, 后缀编号) 四列array
+        self._records = OrderedDict()
+        self._url_buffer = bytearray()
+
+    @classmethod
+    def from_groups(cls, groups):
+        """从 [(分类, [(频道名, 链接), ...]), ...] 构建"""
+        store = cls()
+        for category, channel_list in groups:
+            for channel_name, channel_url in channel_list:
+                store.append(category, channel_name, channel_url)
+        return store
+
+    def _intern(self, value):
+        string_id = self._string_ids.get(value)
+        if string_id is None:
+            string_id = self._string_ids[value] = len(self._strings)
+            self._strings.append(value)
+        return string_id
+
+    def append(self, category, channel_name, channel_url):
+        columns = self._records.get(category)
+        if columns is None:
+            category = self._strings[self._intern(category)]
+            columns = self._records[category] = (array("I"), array("Q"), array("I"), array("I"))
+        base_url, separator, suffix = channel_url.partition("$")
+        encoded_url = base_url.encode("utf-8")
+        columns[0].append(self._intern(channel_name))
+        columns[1].append(len(self._url_buffer))
+        columns[2].append(len(encoded_url))
+        columns[3].append(self._intern(separator + suffix))
+        self._url_buffer += encoded_url
+
+    def reset_category(self, category):
+        """清空分类下已有的记录（分类保留原位置；不存在时新建空分类），对应TXT源中重复出现的分类行"""
+        category = self._strings[self._intern(category)]
+        self._records[category] = (array("I"), array("Q"), array("I"), array("I"))
+
+    def _iter_records(self, categories, name_filter=None):
+        strings = self._strings
+        url_buffer = self._url_buffer
+        accepted = {}
+        for category in categories:
+            for name_id, url_start, url_length, suffix_id in zip(*self._records[category]):
+                if name_filter is not None:
+                    keep = accepted.get(name_id)
+                    if keep is None:
+                        keep = accepted[name_id] = name_filter(strings[name_id])
+                    if not keep:
+                        continue
+                channel_url = url_buffer[url_start:url_start + url_length].decode("utf-8") + strings[suffix_id]
+                yield category, strings[name_id], channel_url
+
+    def iter_records(self, name_filter=None):
+        """按分类顺序遍历所有 (分类, 频道名, 链接)；name_filter按频道名预筛（每个不同的频道名只判断一次，未选中的记录不解码链接）"""
+        return self._iter_records(list(self._records), name_filter)
+
+    def iter_category(self, category):
+        """遍历分类下的 (频道名, 链接)"""
+        return ((channel_name, channel_url) for _, channel_name, channel_url in self._iter_records([category]))
+
+    def record_count(self):
+        return sum(len(columns[0]) for columns in self._records.values())
+
+    def copy(self):
+        store = ChannelStore()
+        store._strings = list(self._strings)
+        store._string_ids = dict(self._string_ids)
+        store._records = OrderedDict(
+            (category, tuple(column[:] for column in columns)) for category, columns in self._records.items()
+        )
+        store._url_buffer = bytearray(self._url_buffer)
+        return store
+
+    def __len__(self):
+        return len(self._records)
+
+    def __iter__(self):
+        return iter(self._records)
+
+    def __contains__(self, category):
+        return category in self._records
+
+    def __getitem__(self, category):
+        return list(self.iter_category(category))
+
+    def keys(self):
+        return self._records.keys()
+
+    def values(self):
+        return (self[category] for category in self._records)
+
+    def items(self):
+        return ((category, self[category]) for category in self._records)
+
+
+# -------------------------- 源响应缓存 --------------------------
+_http_cache_index = None
+_http_cache_lock = threading.Lock()
+
+
+def get_http_cache_dir():
+    """获取源响应缓存目录（不存在则创建）"""
+    cache_dir = os.path.join(config.cache_dir, "http")
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
+
+def load_http_cache_index():
+    """加载源响应缓存索引（索引损坏时丢弃重建）"""
+    global _http_cache_index
+    with _http_cache_lock:
+        if _http_cache_index is None:
+            index_path = os.path.join(get_http_cache_dir(), "index.json")
+            index = {}
+            if os.path.exists(index_path):
+                try:
+                    with open(index_path, "r", encoding="utf-8") as f:
+                        index = json.load(f)
+                except Exception as e:
+                    logging.warning(f"源响应缓存索引损坏，已重建：{str(e)[:100]}")
+                    index = {}
+            _http_cache_index = index
+        return _http_cache_index
+
+
+def get_http_cache_max_age(url):
+    """获取源的缓存有效期（秒）：按源覆盖优先（完整链接或子串匹配），否则取默认值"""
+    overrides = config.http_cache_max_age
+    if url in overrides:
+        return overrides[url]
+    for pattern, max_age in overrides.items():
+        if pattern in url:
+            return max_age
+    return config.http_cache_default_max_age
+
+
+def get_cached_response(url):
+    """查询源响应缓存，返回(缓存条目, 是否仍在有效期内)"""
+    index = load_http_cache_index()
+    with _http_cache_lock:
+        entry = dict(index[url]) if url in index else None
+    if not entry or not os.path.exists(os.path.join(get_http_cache_dir(), f"{entry['key']}.json")):
+        return None, False
+    is_fresh = time.time() - entry.get("fetched_at", 0) < get_http_cache_max_age(url)
+    return entry, is_fresh
+
+
+def load_cached_channels(url, entry):
+    """读取缓存的已解析频道列表（命中时无需重新下载和解析）；缓存文件损坏时删除该条目并返回None，由调用方重新完整下载"""
+    cache_path = os.path.join(get_http_cache_dir(), f"{entry['key']}.json")
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        channels = ChannelStore.from_groups(data)
+    except (OSError, ValueError, TypeError) as e:
+        logging.warning(f"url: {url} 源响应缓存文件损坏，已丢弃：{str(e)[:100]}")
+        with _http_cache_lock:
+            _http_cache_index.pop(url, None)
+        try:
+            os.remove(cache_path)
+        except OSError:
+            pass
+        return None
+    with _http_cache_lock:
+        if url in _http_cache_index:
+            _http_cache_index[url]["last_used"] = time.time()
+    return channels
+
+
+def refresh_cached_response(url, response):
+    """304未修改时刷新缓存条目的校验信息和时间戳"""
+    now = time.time()
+    with _http_cache_lock:
+        entry = _http_cache_index.get(url)
+        if entry:
+            entry["etag"] = response.headers.get("ETag") or entry.get("etag")
+            entry["last_modified"] = response.headers.get("Last-Modified") or entry.get("last_modified")
+            entry["fetched_at"] = now
+            entry["last_used"] = now
+
+
+def store_cached_channels(url, response, channels):
+    """缓存源的已解析频道列表及ETag/Last-Modified（无校验信息且无有效期时不缓存）"""
+    if not channels.record_count():
+        # 解析结果为空（如带ETag的反爬/错误页）不缓存，否则之后每次304都会复用空列表
+        logging.info(f"url: {url} 未解析到频道记录，不写入源响应缓存")
+        return
+
+    etag = response.headers.get("ETag")
+    last_modified = response.headers.get("Last-Modified")
+    if not etag and not last_modified and get_http_cache_max_age(url) <= 0:
+        return
+
+    key = hashlib.sha1(url.encode("utf-8")).hexdigest()
+    payload = json.dumps(list(channels.items()), ensure_ascii=False).encode("utf-8")
+    cache_path = os.path.join(get_http_cache_dir(), f"{key}.json")
+    try:
+        # 先写临时文件再替换，中断时不会留下截断的缓存文件
+        with open(cache_path + ".tmp", "wb") as f:
+            f.write(payload)
+        os.replace(cache_path + ".tmp", cache_path)
+    except Exception as e:
+        logging.warning(f"写入源响应缓存失败：{str(e)[:100]}")
+        return
+
+    now = time.time()
+    with _http_cache_lock:
+        _http_cache_index[url] = {
+            "key": key,
+            "etag": etag,
+            "last_modified": last_modified,
+            "size": len(payload),
+            "fetched_at": now,
+            "last_used": now
+        }
+
+
+def save_http_cache():
+    """按最近使用时间淘汰超出大小上限的缓存条目，并写回缓存索引"""
+    if _http_cache_index is None:
+        return
+    cache_dir = get_http_cache_dir()
+    with _http_cache_lock:
+        total_size = sum(entry.get("size", 0) for entry in _http_cache_index.values())
+        evicted = 0
+        for url, entry in sorted(_http_cache_index.items(), key=lambda item: item[1].get("last_used", 0)):
+            if total_size <= config.http_cache_max_bytes:
+                break
+            try:
+                os.remove(os.path.join(cache_dir, f"{entry['key']}.json"))
+            except OSError:
+                pass
+            total_size -= entry.get("size", 0)
+            del _http_cache_index[url]
+            evicted += 1
+        index_snapshot = dict(_http_cache_index)
+
+    index_path = os.path.join(cache_dir, "index.json")
+    # 批量模式下多个进程共用缓存目录：持有文件锁完成"读取磁盘索引 → 合并 → 替换"，临时文件按进程区分，
+    # 避免两个进程互相覆盖临时文件或后写入者丢掉其他进程的条目（锁在关闭锁文件时释放）
+    tmp_path = f"{index_path}.{os.getpid()}.tmp"
+    try:
+        with open(index_path + ".lock", "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                with open(index_path, "r", encoding="utf-8") as f:
+                    disk_index = json.load(f)
+                for url, entry in disk_index.items():
+                    if url not in index_snapshot or entry.get("fetched_at", 0) > index_snapshot[url].get("fetched_at", 0):
+                        if os.path.exists(os.path.join(cache_dir, f"{entry['key']}.json")):
+                            index_snapshot[url] = entry
+            except (OSError, ValueError):
+                pass
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(index_snapshot, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, index_path)
+        logging.info(f"源响应缓存已保存：{len(index_snapshot)}条，约{total_size / 1024:.1f}KB，淘汰{evicted}条")
+    except Exception as e:
+        logging.error(f"写入源响应缓存索引失败：{str(e)[:100]}")
+
+
+# TXT源中按频道名称关键词推断分类
+TXT_KEYWORD_CATEGORIES = [
+    ('4K', '4K频道'),
+    ('CCTV', '央视频道'),
+    ('卫视', '卫视频道'),
+    ('SD', 'SD频道'),
+    ('海南', '海南地方'),
+]
+
+# TXT源中频道链接格式校验
+CHANNEL_URL_PATTERN = re.compile(
+    r'^(https?|rtp|rtsp|udp)://|'
+    r'^\d{1,3}(\.\d{1,3}){3}:\d+|'
+    r'^[a-zA-Z0-9]+://'
+)
+
+# 流式读取响应时的分块大小（字节）
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def iter_m3u_records(lines):
+    """流式解析M3U格式，逐条产出(分类, 频道名, 链接)"""
+    current_category = None
+    channel_name = None
+
+    for line in lines:
+        line = line.strip()
+        if line.startswith("#EXTINF"):
+            match = re.search(r'group-title="(.*?)",(.*)', line)
+            if match:
+                current_category = match.group(1).strip()
+                channel_name = match.group(2).strip()
+            else:
+                match = re.search(r'tvg-name="(.*?)"', line)
+                if match:
+                    channel_name = match.group(1).strip()
+        elif line and not line.startswith("#"):
+            if current_category and channel_name:
+                yield current_category, channel_name, line
+                channel_name = None
+
+
+def guess_channel_name_from_url(channel_url, line_num):
+    """从链接推断频道名称（文件名 → 主机名 → 行号兜底）"""
+    url_name_match = re.search(r'/([^/]+?)(?:\.m3u8|\.ts|\.mp4)?$', channel_url)
+    if url_name_match:
+        return url_name_match.group(1)
+    host_match = re.search(r'://([^/]+)', channel_url)
+    if host_match:
+        return host_match.group(1)
+    return f"频道_{line_num}"
+
+
+def iter_txt_records(lines, url, on_category_reset=None):
+    """流式解析TXT格式，逐条产出(分类, 频道名, 链接)
+
+    遇到分类行（"分类,#genre#"或链接不合法的"分类,xxx"）时调用on_category_reset(分类)：
+    同一源中分类再次出现时，之前收集的该分类记录由调用方清空（与原先整体解析时 channels[分类] = [] 一致）。
+    """
+    current_category = None
+    line_num = 0
+
+    # 提取默认分类
+    default_category = "默认分类"
+    url_match = re.search(r'/([^/]+?)\.(txt|m3u|m3u8)$', url)
+    if url_match:
+        default_category = url_match.group(1)
+    else:
+        param_match = re.search(r'[?&]name=([^&]+)', url)
+        if param_match:
+            default_category = param_match.group(1)
+
+    for line in lines:
+        line_num += 1
+        line = line.strip()
+
+        if not line:
+            continue
+
+        if line.startswith("#") and len(line) < 50 and "," not in line:
+            continue
+
+        # 分类行处理
+        if "#genre#" in line.lower():
+            parts = line.split(",", 1)
+            if len(parts) >= 2:
+                current_category = parts[0].strip()
+                if on_category_reset:
+                    on_category_reset(current_category)
+                logging.debug(f"发现分类: {current_category}")
+            else:
+                current_category = None
+            continue
+
+        # 频道行处理
+        if "," in line:
+            parts = line.split(",", 1)
+            channel_name = parts[0].strip()
+            channel_url = parts[1].strip()
+
+            if CHANNEL_URL_PATTERN.search(channel_url):
+                # 清理频道名称
+                channel_name = re.sub(r'[#].*$', '', channel_name).strip()
+
+                # 关键词匹配分类
+                if current_category is None:
+                    matched_category = None
+                    for keyword, cat in TXT_KEYWORD_CATEGORIES:
+                        if keyword in channel_name:
+                            matched_category = cat
+                            break
+                    current_category = matched_category if matched_category else default_category
+                    logging.debug(f"根据频道名称匹配分类: {channel_name} → {current_category}")
+
+                # 补全默认频道名称
+                if not channel_name:
+                    channel_name = guess_channel_name_from_url(channel_url, line_num)
+
+                yield current_category, channel_name, channel_url
+            else:
+                potential_category = line.split(",")[0].strip()
+                if potential_category and len(potential_category) < 50:
+                    current_category = potential_category
+                    if on_category_reset:
+                        on_category_reset(current_category)
+                    logging.debug(f"发现无标记分类: {current_category}")
+        elif re.search(r'^(https?|rtp|rtsp|udp)://|^\d{1,3}(\.\d{1,3}){3}:\d+', line):
+            # 纯URL行处理
+            channel_name = guess_channel_name_from_url(line, line_num)
+            if current_category is None:
+                current_category = default_category
+            yield current_category, channel_name, line
+
+
+def iter_channel_records(lines, url="", on_category_reset=None):
+    """流式解析频道列表，根据前10行判断M3U/TXT格式，逐条产出(分类, 频道名, 链接)（on_category_reset见iter_txt_records）"""
+    lines = iter(lines)
+    head_lines = []
+    for line in lines:
+        # 与整体strip后取前10行的判断保持一致：跳过开头空行
+        if not head_lines and not line.strip():
+            continue
+        head_lines.append(line)
+        if len(head_lines) >= 10:
+            break
+
+    is_m3u = any("#EXTINF" in line for line in head_lines)
+    logging.info(f"url: {url} 判断为{'m3u' if is_m3u else 'txt'}格式")
+
+    all_lines = itertools.chain(head_lines, lines)
+    if is_m3u:
+        yield from iter_m3u_records(all_lines)
+    else:
+        yield from iter_txt_records(all_lines, url, on_category_reset)
+
+
 def fetch_channels(url):
-    """爬取频道信息"""
-    channels = OrderedDict()
+    """爬取频道信息（流式读取并解析响应，不在内存中保留完整响应体；解析结果存入紧凑的ChannelStore）"""
+    channels = ChannelStore()
 
     try:
         headers = {
@@ -1102,201 +1995,564 @@ def fetch_channels(url):
             'Connection': 'keep-alive',
         }
 
-        response = requests.get(url, headers=headers, allow_redirects=True, timeout=10)
-        response.raise_for_status()
-        response.encoding = 'utf-8'
-        text = response.text.strip()
-
-        logging.info(f"url: {url} 响应状态: {response.status_code}")
-        logging.info(f"响应内容长度: {len(text)} 字符")
-        logging.info(f"响应前200字符: {text[:200] if text else '空响应'}")
-
-        lines = text.splitlines() if text else []
-        is_m3u = any("#EXTINF" in line for line in lines[:10]) if lines else False
-        source_type = "m3u" if is_m3u else "txt"
-        logging.info(f"url: {url} 获取成功，判断为{source_type}格式，共 {len(lines)} 行")
-
-        if is_m3u:
-            # M3U格式解析
-            current_category = None
-            channel_name = None
-
-            for line in lines:
-                line = line.strip()
-                if line.startswith("#EXTINF"):
-                    match = re.search(r'group-title="(.*?)",(.*)', line)
-                    if match:
-                        current_category = match.group(1).strip()
-                        channel_name = match.group(2).strip()
-                        if current_category not in channels:
-                            channels[current_category] = []
-                    else:
-                        match = re.search(r'tvg-name="(.*?)"', line)
-                        if match:
-                            channel_name = match.group(1).strip()
-                elif line and not line.startswith("#"):
-                    channel_url = line.strip()
-                    if current_category and channel_name:
-                        channels[current_category].append((channel_name, channel_url))
-                        channel_name = None
-        else:
-            # TXT格式解析
-            current_category = None
-            line_num = 0
-
-            # 关键词到分类的映射
-            keyword_categories = [
-                ('4K', '4K频道'),
-                ('CCTV', '央视频道'),
-                ('卫视', '卫视频道'),
-                ('SD', 'SD频道'),
-                ('海南', '海南地方'),
-            ]
-
-            # 提取默认分类
-            default_category = "默认分类"
-            url_match = re.search(r'/([^/]+?)\.(txt|m3u|m3u8)$', url)
-            if url_match:
-                default_category = url_match.group(1)
-            else:
-                param_match = re.search(r'[?&]name=([^&]+)', url)
-                if param_match:
-                    default_category = param_match.group(1)
-
-            for line in lines:
-                line_num += 1
-                line = line.strip()
-
-                if not line:
-                    continue
-
-                if line.startswith("#") and len(line) < 50 and "," not in line:
-                    continue
-
-                # 分类行处理
-                if "#genre#" in line.lower():
-                    parts = line.split(",", 1)
-                    if len(parts) >= 2:
-                        current_category = parts[0].strip()
-                        channels[current_category] = []
-                        logging.debug(f"发现分类: {current_category}")
-                    else:
-                        current_category = None
-                    continue
-
-                # 频道行处理
-                if "," in line:
-                    if line.lower().endswith("#genre#"):
-                        current_category = line.split(",")[0].strip()
-                        channels[current_category] = []
-                        logging.debug(f"发现无标记分类: {current_category}")
-                        continue
-
-                    parts = line.split(",", 1)
-                    if len(parts) == 2:
-                        channel_name = parts[0].strip()
-                        channel_url = parts[1].strip()
-
-                        # 验证URL格式
-                        url_pattern = re.compile(
-                            r'^(https?|rtp|rtsp|udp)://|'
-                            r'^\d{1,3}(\.\d{1,3}){3}:\d+|'
-                            r'^[a-zA-Z0-9]+://'
-                        )
-
-                        if url_pattern.search(channel_url):
-                            # 清理频道名称
-                            channel_name = re.sub(r'[#].*$', '', channel_name).strip()
-
-                            # 关键词匹配分类
-                            if current_category is None:
-                                matched_category = None
-                                for keyword, cat in keyword_categories:
-                                    if keyword in channel_name:
-                                        matched_category = cat
-                                        break
-                                current_category = matched_category if matched_category else default_category
-                                if current_category not in channels:
-                                    channels[current_category] = []
-                                logging.debug(f"根据频道名称匹配分类: {channel_name} → {current_category}")
-
-                            # 补全默认频道名称
-                            if not channel_name:
-                                url_name_match = re.search(r'/([^/]+?)(?:\.m3u8|\.ts|\.mp4)?$', channel_url)
-                                if url_name_match:
-                                    channel_name = url_name_match.group(1)
-                                else:
-                                    host_match = re.search(r'://([^/]+)', channel_url)
-                                    if host_match:
-                                        channel_name = host_match.group(1)
-                                    else:
-                                        channel_name = f"频道_{line_num}"
-
-                            # 添加频道
-                            channels[current_category].append((channel_name, channel_url))
-                            logging.debug(f"添加频道: {channel_name} -> {channel_url[:50]}...")
-                        else:
-                            potential_category = line.split(",")[0].strip()
-                            if potential_category and len(potential_category) < 50:
-                                current_category = potential_category
-                                channels[current_category] = []
-                                logging.debug(f"发现无标记分类: {current_category}")
-                elif line and re.search(r'^(https?|rtp|rtsp|udp)://|^\d{1,3}(\.\d{1,3}){3}:\d+', line):
-                    # 纯URL行处理
-                    channel_url = line.strip()
-                    url_name_match = re.search(r'/([^/]+?)(?:\.m3u8|\.ts|\.mp4)?$', channel_url)
-                    if url_name_match:
-                        channel_name = url_name_match.group(1)
-                    else:
-                        host_match = re.search(r'://([^/]+)', channel_url)
-                        if host_match:
-                            channel_name = host_match.group(1)
-                        else:
-                            channel_name = f"频道_{line_num}"
-
-                    if current_category is None:
-                        current_category = default_category
-                        if current_category not in channels:
-                            channels[current_category] = []
-                    channels[current_category].append((channel_name, channel_url))
-                    logging.debug(f"添加纯URL频道: {channel_name} -> {channel_url[:50]}...")
+        # 缓存在有效期内直接复用；否则带上ETag/Last-Modified发条件请求
+        cached_entry, is_fresh = get_cached_response(url)
+        if cached_entry and is_fresh:
+            cached_channels = load_cached_channels(url, cached_entry)
+            if cached_channels is not None:
+                logging.info(f"url: {url} 命中源响应缓存（有效期内），跳过请求")
+                return cached_channels
+            cached_entry = None
+        if cached_entry:
+            if cached_entry.get("etag"):
+                headers['If-None-Match'] = cached_entry["etag"]
+            if cached_entry.get("last_modified"):
+                headers['If-Modified-Since'] = cached_entry["last_modified"]
+
+        with get_http_session().get(url, headers=headers, allow_redirects=True, timeout=10,
+                                    stream=True) as response:
+            if response.status_code == 304 and cached_entry:
+                cached_channels = load_cached_channels(url, cached_entry)
+                if cached_channels is None:
+                    # 缓存条目已丢弃，重新请求时不再带条件头，完整下载并解析
+                    return fetch_channels(url)
+                logging.info(f"url: {url} 响应304未修改，复用缓存的解析结果")
+                refresh_cached_response(url, response)
+                return cached_channels
+            response.raise_for_status()
+            response.encoding = 'utf-8'
+            logging.info(f"url: {url} 响应状态: {response.status_code}")
+
+            lines = response.iter_lines(chunk_size=STREAM_CHUNK_SIZE, decode_unicode=True)
+            for category, channel_name, channel_url in iter_channel_records(lines, url, channels.reset_category):
+                channels.append(category, channel_name, channel_url)
+
+        logging.info(f"url: {url} 获取成功，共解析 {channels.record_count()} 条频道记录，{len(channels)} 个分类")
+        store_cached_channels(url, response, channels)
     except Exception as e:
         logging.error(f"爬取频道失败: {str(e)[:200]}")
 
     return channels
 
 
+# -------------------------- 频道名规范化 --------------------------
+# 规范化时移除的标点/空白（保留"+"，如CCTV5+）
+CHANNEL_NAME_PUNCTUATION_PATTERN = re.compile(r"[^\w+]|_")
+
+
+@lru_cache(maxsize=1)
+def get_channel_name_rules():
+    """编译频道名规范化规则（清晰度标记、台号后描述、别名表），整个运行只构建一次"""
+    def prepare(words):
+        words = (unicodedata.normalize("NFKC", word).upper() for word in words)
+        return sorted({CHANNEL_NAME_PUNCTUATION_PATTERN.sub("", word) for word in words if word}, key=len, reverse=True)
+
+    quality_tags = prepare(config.channel_quality_tags)
+    # 含拉丁字母的标记只在不与其他字母相连时移除（CCTV1HD → CCTV1，HDTV、SHD频道保持不变）；中文标记任意位置移除
+    quality_pattern = re.compile("|".join(
+        rf"(?<![A-Z]){re.escape(tag)}(?![A-Z])" if re.search("[A-Z]", tag) else re.escape(tag)
+        for tag in quality_tags)) if quality_tags else None
+    # 台号后的描述只在紧跟数字或"+"时移除（CCTV1综合 → CCTV1，海南新闻保持不变）
+    descriptors = prepare(config.channel_name_descriptors)
+    descriptor_pattern = re.compile(r"(?<=[\d+])(?:" + "|".join(map(re.escape, descriptors)) + r")$") if descriptors else None
+
+    aliases = {}
+    for alias, target in config.channel_aliases.items():
+        aliases[strip_channel_name(alias, quality_pattern, descriptor_pattern)] = \
+            strip_channel_name(target, quality_pattern, descriptor_pattern)
+    return quality_pattern, descriptor_pattern, aliases
+
+
+def strip_channel_name(name, quality_pattern, descriptor_pattern):
+    """去除全半角差异、大小写、清晰度标记、标点和台号后描述"""
+    name = unicodedata.normalize("NFKC", name).upper()
+    if quality_pattern:
+        name = quality_pattern.sub("", name)
+    name = CHANNEL_NAME_PUNCTUATION_PATTERN.sub("", name)
+    if descriptor_pattern:
+        name = descriptor_pattern.sub("", name)
+    return name
+
+
+@lru_cache(maxsize=None)
+def normalize_channel_name(name):
+    """频道名规范化（按原始名称缓存，同名频道在各源中重复出现时只计算一次）"""
+    quality_pattern, descriptor_pattern, aliases = get_channel_name_rules()
+    canonical_name = strip_channel_name(name, quality_pattern, descriptor_pattern)
+    return aliases.get(canonical_name, canonical_name) or name
+
+
+def build_channel_index(all_channels, key_func=None, wanted_keys=None):
+    """将所有在线频道构建为 频道名 → [链接] 索引（链接顺序与按分类遍历一致），key_func用于规范化频道名；
+    wanted_keys不为None时只索引其中的频道（模板用不到的记录不生成链接字符串）"""
+    get_key = key_func or (lambda channel_name: channel_name)
+    name_filter = None if wanted_keys is None else (lambda channel_name: get_key(channel_name) in wanted_keys)
+    channel_index = {}
+    for _, online_channel_name, online_channel_url in all_channels.iter_records(name_filter):
+        channel_index.setdefault(get_key(online_channel_name), []).append(online_channel_url)
+    return channel_index
+
+
 def match_channels(template_channels, all_channels):
-    """保留代码1的频道匹配功能"""
+    """频道匹配：索引只构建一次，每个模板频道一次字典查找（开启模糊匹配时按规范化名称查找）"""
+    key_func = normalize_channel_name if config.fuzzy_channel_match else None
+    wanted_keys = {key_func(channel_name) if key_func else channel_name
+                   for channel_list in template_channels.values() for channel_name in channel_list}
+    channel_index = build_channel_index(all_channels, key_func, wanted_keys)
     matched_channels = OrderedDict()
 
     for category, channel_list in template_channels.items():
         matched_channels[category] = OrderedDict()
         for channel_name in channel_list:
-            for online_category, online_channel_list in all_channels.items():
-                for online_channel_name, online_channel_url in online_channel_list:
-                    if channel_name == online_channel_name:
-                        matched_channels[category].setdefault(channel_name, []).append(online_channel_url)
+            online_urls = channel_index.get(key_func(channel_name) if key_func else channel_name)
+            if online_urls:
+                matched_channels[category].setdefault(channel_name, []).extend(online_urls)
 
     return matched_channels
 
 
-def filter_source_urls(template_file, province_input="海南"):
-    """修改：支持传入省份参数"""
+# -------------------------- URL黑名单 --------------------------
+@lru_cache(maxsize=1)
+def get_url_blacklist_pattern():
+    """把config.url_blacklist编译为前缀树正则（只构建一次），每个URL单次扫描即可判断是否命中任一黑名单片段"""
+    trie = {}
+    for pattern in config.url_blacklist:
+        if not pattern:
+            continue
+        node = trie
+        for char in pattern:
+            # 已有更短的黑名单片段是当前片段的前缀，更长的片段无需再展开
+            if "" in node:
+                break
+            node = node.setdefault(char, {})
+        else:
+            node.clear()
+            node[""] = True
+
+    def node_to_regex(node):
+        if "" in node:
+            return ""
+        alternatives = [re.escape(char) + node_to_regex(child) for char, child in sorted(node.items())]
+        return alternatives[0] if len(alternatives) == 1 else "(?:" + "|".join(alternatives) + ")"
+
+    return re.compile(node_to_regex(trie)) if trie else None
+
+
+def is_url_blacklisted(url):
+    """判断URL是否包含任一黑名单片段（与逐个子串判断结果一致）"""
+    pattern = get_url_blacklist_pattern()
+    return pattern is not None and pattern.search(url) is not None
+
+
+def merge_channels(all_channels, fetched_channels):
+    """把单个源的频道按分类合并进all_channels（解析后即丢弃黑名单链接，后续阶段不再处理）"""
+    for category, channel_name, channel_url in fetched_channels.iter_records():
+        if not is_url_blacklisted(channel_url):
+            all_channels.append(category, channel_name, channel_url)
+    return all_channels
+
+
+def fetch_all_channels(source_urls):
+    """并发爬取所有源链接，按源链接顺序合并频道（合并结果与串行爬取一致）"""
+    all_channels = ChannelStore()
+    if not source_urls:
+        return all_channels
+
+    max_workers = max(1, min(config.fetch_max_workers, len(source_urls)))
+    start_time = time.time()
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="fetch") as executor:
+        # executor.map按输入顺序返回结果，保证合并顺序与config一致
+        for fetched_channels in executor.map(fetch_channels, source_urls):
+            merge_channels(all_channels, fetched_channels)
+
+    save_http_cache()
+    logging.info(f"并发爬取{len(source_urls)}个源完成（并发数：{max_workers}），耗时：{time.time() - start_time:.2f}秒")
+    return all_channels
+
+
+# -------------------------- 线路探测 --------------------------
+PROBE_REDIRECT_STATUS = (301, 302, 303, 307, 308)
+# TS包长度及同步字节；HLS播放列表和常见流媒体Content-Type也视为有效媒体（HTML错误页、认证门户页不算）
+TS_PACKET_SIZE = 188
+TS_SYNC_BYTE = 0x47
+MEDIA_CONTENT_TYPES = ("video/", "application/vnd.apple.mpegurl", "application/x-mpegurl",
+                       "audio/mpegurl", "audio/x-mpegurl")
+
+
+def is_ts_payload(data, packet_count=3):
+    """数据中是否有连续packet_count个188字节对齐的0x47同步字节（允许从包中间开始）"""
+    needed = TS_PACKET_SIZE * (packet_count - 1) + 1
+    for offset in range(min(TS_PACKET_SIZE, len(data) - needed + 1)):
+        if all(data[offset + i * TS_PACKET_SIZE] == TS_SYNC_BYTE for i in range(packet_count)):
+            return True
+    return False
+
+
+def is_media_response(content_type, head):
+    """根据响应开头的数据（TS同步字节、#EXTM3U）或Content-Type判断是否为媒体流"""
+    if is_ts_payload(head) or head.lstrip().startswith(b"#EXTM3U"):
+        return True
+    content_type = content_type.split(";", 1)[0].strip().lower()
+    return bool(content_type) and content_type.startswith(MEDIA_CONTENT_TYPES)
+
+
+async def iter_response_body(reader, headers):
+    """按Transfer-Encoding逐块产出响应体（chunked时解码分块，否则原样读取到连接关闭）"""
+    if "chunked" not in headers.get("transfer-encoding", "").lower():
+        while True:
+            chunk = await reader.read(64 * 1024)
+            if not chunk:
+                return
+            yield chunk
+    while True:
+        size_line = await reader.readline()
+        try:
+            chunk_size = int(size_line.split(b";", 1)[0].strip(), 16)
+        except ValueError:
+            raise ValueError(f"无效的分块长度：{size_line[:50]!r}")
+        if chunk_size == 0:
+            return
+        yield await reader.readexactly(chunk_size)
+        await reader.readline()
+
+
+async def read_stream_sample(url, redirects_left=3):
+    """请求流地址并读取一段数据，返回(首字节耗时, 读取字节数, 读取耗时, 是否为媒体流)"""
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https"):
+        raise ValueError(f"不支持的协议：{parts.scheme}")
+    port = parts.port or (443 if parts.scheme == "https" else 80)
+    path = parts.path or "/"
+    if parts.query:
+        path += f"?{parts.query}"
+
+    ssl_context = None
+    if parts.scheme == "https":
+        # 只判断能否出流，不校验证书（大量源使用自签证书）
+        ssl_context = ssl.create_default_context()
+        ssl_context.check_hostname = False
+        ssl_context.verify_mode = ssl.CERT_NONE
+
+    start_time = time.perf_counter()
+    reader, writer = await asyncio.wait_for(
+        asyncio.open_connection(parts.hostname, port, ssl=ssl_context), timeout=config.probe_connect_timeout)
+    try:
+        request = (
+            f"GET {path} HTTP/1.1\r\n"
+            f"Host: {parts.netloc.rsplit('@', 1)[-1]}\r\n"
+            f"User-Agent: {USER_AGENT_POOL[0]}\r\n"
+            "Accept: */*\r\n"
+            "Connection: close\r\n\r\n"
+        )
+        writer.write(request.encode("latin-1"))
+        await writer.drain()
+
+        status_line = await reader.readline()
+        ttfb = time.perf_counter() - start_time
+        status_parts = status_line.split()
+        if len(status_parts) < 2 or not status_parts[1].isdigit():
+            raise ValueError(f"无效的响应行：{status_line[:50]!r}")
+        status = int(status_parts[1])
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        if status in PROBE_REDIRECT_STATUS and headers.get("location") and redirects_left > 0:
+            return await read_stream_sample(urljoin(url, headers["location"]), redirects_left - 1)
+        if not 200 <= status < 300:
+            raise ValueError(f"响应状态码：{status}")
+
+        received = 0
+        head = b""
+        read_start = time.perf_counter()
+        async for chunk in iter_response_body(reader, headers):
+            if len(head) < TS_PACKET_SIZE * 4:
+                head += chunk[:TS_PACKET_SIZE * 4 - len(head)]
+            received += len(chunk)
+            if received >= config.probe_read_bytes:
+                break
+        return ttfb, received, time.perf_counter() - read_start, is_media_response(headers.get("content-type", ""), head)
+    finally:
+        writer.close()
+
+
+async def probe_stream_url(url, semaphore):
+    """探测单条链接：ok为True可用（2xx且返回媒体数据：TS同步字节、HLS播放列表或媒体Content-Type）/False不可用/None无法探测（非HTTP协议）"""
+    base_url = url.split('$', 1)[0]
+    if not base_url.startswith(("http://", "https://")):
+        return {"ok": None, "ttfb": None, "throughput": 0.0}
+
+    async with semaphore:
+        try:
+            ttfb, received, read_elapsed, is_media = await asyncio.wait_for(
+                read_stream_sample(base_url), timeout=config.probe_timeout)
+        except Exception as e:
+            logging.debug(f"探测失败 {base_url[:80]}：{str(e)[:100]}")
+            return {"ok": False, "ttfb": None, "throughput": 0.0}
+
+    throughput = received / read_elapsed if read_elapsed > 0 else float(received)
+    ok = received > 0 and is_media and throughput >= config.probe_min_throughput
+    return {"ok": ok, "ttfb": ttfb, "throughput": throughput}
+
+
+async def probe_stream_urls(urls):
+    """并发探测所有链接（全局并发上限config.probe_max_concurrency），返回 链接 → 探测结果"""
+    semaphore = asyncio.Semaphore(max(1, config.probe_max_concurrency))
+    results = await asyncio.gather(*(probe_stream_url(url, semaphore) for url in urls))
+    return dict(zip(urls, results))
+
+
+def probe_quality_key(result):
+    """线路排序键：实测可用的按吞吐量降序、首字节耗时升序，无法探测的排在最后"""
+    if result["ok"]:
+        return 0, -result["throughput"], result["ttfb"]
+    return 1, 0.0, 0.0
+
+
+# -------------------------- 探测结果存储 --------------------------
+PROBE_STORE_BATCH_SIZE = 500
+
+
+def normalize_probe_url(url):
+    """探测结果存储的键：去掉$后缀，协议和主机名统一小写（用户名密码、端口和路径保持原样，凭据区分大小写）"""
+    base_url = url.split('$', 1)[0].strip()
+    parts = urlsplit(base_url)
+    if not parts.scheme or not parts.netloc:
+        return base_url
+    userinfo, separator, hostport = parts.netloc.rpartition("@")
+    if hostport.startswith("["):
+        host, bracket, port = hostport.partition("]")
+        hostport = host.lower() + bracket + port
+    else:
+        host, colon, port = hostport.partition(":")
+        hostport = host.lower() + colon + port
+    return parts._replace(scheme=parts.scheme.lower(), netloc=userinfo + separator + hostport).geturl()
+
+
+def open_probe_store():
+    """打开探测结果存储（SQLite，位于缓存目录）"""
+    os.makedirs(config.cache_dir, exist_ok=True)
+    connection = sqlite3.connect(os.path.join(config.cache_dir, "probe_results.sqlite3"))
+    connection.execute("""
+        CREATE TABLE IF NOT EXISTS probe_results (
+            url TEXT PRIMARY KEY,
+            probed_at REAL NOT NULL,
+            ok INTEGER NOT NULL,
+            ttfb REAL,
+            throughput REAL NOT NULL,
+            fail_count INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    return connection
+
+
+def load_probe_results(connection, keys):
+    """分批读取探测结果，返回 键 → 记录"""
+    stored_results = {}
+    keys = list(keys)
+    for offset in range(0, len(keys), PROBE_STORE_BATCH_SIZE):
+        batch = keys[offset:offset + PROBE_STORE_BATCH_SIZE]
+        rows = connection.execute(
+            f"SELECT url, probed_at, ok, ttfb, throughput, fail_count FROM probe_results "
+            f"WHERE url IN ({','.join('?' * len(batch))})", batch)
+        for url, probed_at, ok, ttfb, throughput, fail_count in rows:
+            stored_results[url] = {"probed_at": probed_at, "ok": bool(ok), "ttfb": ttfb,
+                                   "throughput": throughput, "fail_count": fail_count}
+    return stored_results
+
+
+def is_probe_result_fresh(stored_result, now):
+    """可用链接在TTL内免探测；不可用链接按连续失败次数指数退避后才重试"""
+    age = now - stored_result["probed_at"]
+    if stored_result["ok"]:
+        return age < config.probe_result_ttl
+    retry_after = config.probe_dead_retry_base * 2 ** max(stored_result["fail_count"] - 1, 0)
+    return age < min(retry_after, config.probe_dead_retry_max)
+
+
+def save_probe_results(connection, new_results, stored_results, now):
+    """在一个事务中批量写入本次探测结果（无法探测的链接不记录）"""
+    rows = []
+    for key, result in new_results.items():
+        if result["ok"] is None:
+            continue
+        previous_fail_count = stored_results[key]["fail_count"] if key in stored_results else 0
+        fail_count = 0 if result["ok"] else previous_fail_count + 1
+        rows.append((key, now, int(result["ok"]), result["ttfb"], result["throughput"], fail_count))
+    with connection:
+        connection.executemany(
+            "INSERT OR REPLACE INTO probe_results (url, probed_at, ok, ttfb, throughput, fail_count) "
+            "VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+
+def probe_with_store(keys):
+    """复用探测结果存储中仍有效的结果，只探测过期或缺失的链接"""
+    now = time.time()
+    try:
+        connection = open_probe_store()
+    except sqlite3.Error as e:
+        logging.warning(f"打开探测结果存储失败，全部重新探测：{str(e)[:100]}")
+        return asyncio.run(probe_stream_urls(keys))
+
+    try:
+        stored_results = load_probe_results(connection, keys)
+        key_results = {key: stored_results[key] for key in keys
+                       if key in stored_results and is_probe_result_fresh(stored_results[key], now)}
+        pending_keys = [key for key in keys if key not in key_results]
+        logging.info(f"探测结果存储命中{len(key_results)}条，待探测{len(pending_keys)}条")
+
+        new_results = asyncio.run(probe_stream_urls(pending_keys)) if pending_keys else {}
+        key_results.update(new_results)
+        save_probe_results(connection, new_results, stored_results, now)
+    except sqlite3.Error as e:
+        logging.warning(f"读写探测结果存储失败：{str(e)[:100]}")
+        key_results = asyncio.run(probe_stream_urls(keys))
+    finally:
+        connection.close()
+    return key_results
+
+
+# -------------------------- 主机健康检查与熔断 --------------------------
+def get_probe_host(key):
+    """链接所在的主机(host, port)，非HTTP链接返回None"""
+    parts = urlsplit(key)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        return None
+    try:
+        return parts.hostname, parts.port or (443 if parts.scheme == "https" else 80)
+    except ValueError:
+        return None
+
+
+async def check_stream_host(host, semaphore):
+    """主机级廉价检查：只建立TCP连接，返回连接耗时（秒），失败返回None"""
+    async with semaphore:
+        start_time = time.perf_counter()
+        try:
+            _, writer = await asyncio.wait_for(asyncio.open_connection(*host), timeout=config.probe_connect_timeout)
+        except Exception:
+            return None
+        latency = time.perf_counter() - start_time
+        writer.close()
+        return latency
+
+
+async def check_stream_hosts(hosts):
+    """并发检查所有主机，返回 主机 → 连接耗时/None"""
+    semaphore = asyncio.Semaphore(max(1, config.probe_max_concurrency))
+    latencies = await asyncio.gather(*(check_stream_host(host, semaphore) for host in hosts))
+    return dict(zip(hosts, latencies))
+
+
+def pick_host_samples(keys, sample_size):
+    """在同一主机的链接中均匀抽取样本"""
+    if len(keys) <= sample_size:
+        return list(keys)
+    step = len(keys) / sample_size
+    return [keys[int(i * step)] for i in range(sample_size)]
+
+
+def probe_hosts_with_breaker(keys):
+    """按host:port分组：每个主机检查一次并抽样探测，主机不可用时熔断其全部链接，其余链接沿用主机的实测结果"""
+    host_keys = OrderedDict()
+    key_results = {}
+    for key in keys:
+        host = get_probe_host(key)
+        if host is None:
+            key_results[key] = {"ok": None, "ttfb": None, "throughput": 0.0}
+        else:
+            host_keys.setdefault(host, []).append(key)
+    if not host_keys:
+        return key_results
+
+    host_latencies = asyncio.run(check_stream_hosts(list(host_keys)))
+    host_samples = {host: pick_host_samples(host_key_list, config.probe_host_sample_size)
+                    for host, host_key_list in host_keys.items() if host_latencies[host] is not None}
+    sample_results = probe_with_store([key for samples in host_samples.values() for key in samples])
+
+    tripped_hosts = []
+    for host, host_key_list in host_keys.items():
+        alive_samples = [sample_results[key] for key in host_samples.get(host, []) if sample_results[key]["ok"]]
+        if not alive_samples:
+            # 熔断：主机连不上或抽样全部失败，整台主机的链接剔除（或降到最后）
+            tripped_hosts.append(host)
+            breaker_result = {"ok": False if config.probe_host_breaker_action == "drop" else None,
+                              "ttfb": None, "throughput": 0.0}
+            for key in host_key_list:
+                key_results[key] = breaker_result
+            continue
+
+        host_result = {
+            "ok": True,
+            "ttfb": sorted(result["ttfb"] for result in alive_samples)[len(alive_samples) // 2],
+            "throughput": sorted(result["throughput"] for result in alive_samples)[len(alive_samples) // 2]
+        }
+        for key in host_key_list:
+            key_results[key] = sample_results.get(key, host_result)
+
+    logging.info(f"主机健康检查：共{len(host_keys)}台主机，熔断{len(tripped_hosts)}台，"
+                 f"抽样探测{len(sample_results)}条链接（共{len(keys)}条）")
+    for hostname, port in tripped_hosts[:20]:
+        logging.info(f"   熔断主机：{hostname}:{port}（{len(host_keys[(hostname, port)])}条链接）")
+    return key_results
+
+
+def probe_matched_channels(matched_channels):
+    """线路探测阶段：剔除不可用链接，其余按实测质量排序（结构与match_channels输出一致）"""
+    url_keys = OrderedDict(
+        (url, normalize_probe_url(url))
+        for channel_urls in matched_channels.values() for url_list in channel_urls.values() for url in url_list
+    )
+    if not url_keys:
+        return matched_channels
+
+    start_time = time.time()
+    keys = list(OrderedDict.fromkeys(url_keys.values()))
+    key_results = probe_hosts_with_breaker(keys) if config.probe_host_mode else probe_with_store(keys)
+    probe_results = {url: key_results[key] for url, key in url_keys.items()}
+    alive_count = sum(1 for result in key_results.values() if result["ok"])
+    dead_count = sum(1 for result in key_results.values() if result["ok"] is False)
+    logging.info(f"线路探测完成：共{len(keys)}条，可用{alive_count}条，不可用{dead_count}条，"
+                 f"无法探测{len(keys) - alive_count - dead_count}条，耗时：{time.time() - start_time:.2f}秒")
+
+    probed_channels = OrderedDict()
+    for category, channel_urls in matched_channels.items():
+        probed_channels[category] = OrderedDict()
+        for channel_name, url_list in channel_urls.items():
+            alive_urls = [url for url in url_list if probe_results[url]["ok"] is not False]
+            if alive_urls:
+                probed_channels[category][channel_name] = sorted(
+                    alive_urls, key=lambda url: probe_quality_key(probe_results[url]))
+    return probed_channels
+
+
+def filter_source_urls(template_file, province_input="海南", static_channels=None, storage_key=None,
+                       static_only=False):
+    """修改：支持传入省份参数；static_channels为已抓取好的config源频道（批量模式下各省份共用，不再重复抓取）；
+    static_only为True时只处理config源，不启动浏览器抓取组播源"""
     template_channels = parse_template(template_file)
-    # 获取合并后的所有源链接（传入省份参数）
-    source_urls = get_all_source_urls(province_input)
-
-    all_channels = OrderedDict()
-    for url in source_urls:
-        fetched_channels = fetch_channels(url)
-        for category, channel_list in fetched_channels.items():
-            if category in all_channels:
-                all_channels[category].extend(channel_list)
-            else:
-                all_channels[category] = channel_list
+    if static_only:
+        source_urls = list(config.source_urls)
+    else:
+        # 获取合并后的所有源链接（传入省份参数）
+        source_urls = get_all_source_urls(province_input, storage_key)
+
+    if static_channels is None:
+        all_channels = fetch_all_channels(source_urls)
+    else:
+        # config源在前、动态源在后，与单省份模式的合并顺序一致
+        all_channels = static_channels.copy()
+        dynamic_urls = [url for url in source_urls if url not in config.source_urls]
+        merge_channels(all_channels, fetch_all_channels(dynamic_urls))
 
     matched_channels = match_channels(template_channels, all_channels)
+    if config.probe_enabled:
+        matched_channels = probe_matched_channels(matched_channels)
 
     return matched_channels, template_channels
 
@@ -1306,76 +2562,705 @@ def is_ipv6(url):
     return re.match(r'^http:\/\/\[[0-9a-fA-F:]+\]', url) is not None
 
 
-def updateChannelUrlsM3U(channels, template_channels):
-    """保留代码1的M3U/TXT生成功能"""
+# 公告中的更新时间每次运行都不同，比较输出内容时需排除
+OUTPUT_TIMESTAMP_PATTERN = re.compile(r"\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}")
+
+
+def get_output_digest(content):
+    """输出内容摘要（时间戳替换为占位符后计算，只反映频道内容的变化）"""
+    return hashlib.sha256(OUTPUT_TIMESTAMP_PATTERN.sub("<timestamp>", content).encode("utf-8")).hexdigest()
+
+
+def write_output_if_changed(output_file, content, compress=False):
+    """内容（排除时间戳）与现有文件不同时才原子替换写入，返回是否写入；compress为True时写gzip（mtime固定为0，同样内容字节一致）"""
+    if os.path.exists(output_file):
+        try:
+            with (gzip.open(output_file, "rt", encoding="utf-8") if compress
+                  else open(output_file, "r", encoding="utf-8")) as f:
+                if get_output_digest(f.read()) == get_output_digest(content):
+                    logging.info(f"{output_file} 内容未变化，跳过写入")
+                    return False
+        except (OSError, EOFError, UnicodeDecodeError) as e:
+            logging.warning(f"读取现有输出文件失败，直接覆盖：{output_file}，错误：{str(e)[:100]}")
+
+    with open(output_file + ".tmp", "wb") as f:
+        f.write(gzip.compress(content.encode("utf-8"), mtime=0) if compress else content.encode("utf-8"))
+    os.replace(output_file + ".tmp", output_file)
+    logging.info(f"{output_file} 已更新")
+    return True
+
+
+def report_output_changed(changed):
+    """在GitHub Actions中把输出是否变化写入GITHUB_OUTPUT（outputs_changed=true/false），供工作流跳过无变化的提交"""
+    github_output = os.environ.get("GITHUB_OUTPUT")
+    if github_output:
+        with open(github_output, "a", encoding="utf-8") as f:
+            f.write(f"outputs_changed={'true' if changed else 'false'}\n")
+    if not changed:
+        logging.info("输出文件内容均未变化（unchanged）")
+
+
+# -------------------------- 台标检查 --------------------------
+def get_logo_cache_path():
+    os.makedirs(config.cache_dir, exist_ok=True)
+    return os.path.join(config.cache_dir, "logo_status.json")
+
+
+def load_logo_cache():
+    """读取台标检查缓存：台标地址 → {"ok": 是否存在, "checked_at": 检查时间}（文件损坏时视为空）
+
+    以完整台标地址为键，修改config.logo_url_template后旧地址的检查结果不会被复用。
+    """
+    cache_path = get_logo_cache_path()
+    if not os.path.exists(cache_path):
+        return {}
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        logging.warning(f"台标检查缓存损坏，已忽略：{str(e)[:100]}")
+        return {}
+
+
+def save_logo_cache(cache, now):
+    """写回台标检查缓存（过期条目不再保留，避免更换模板后旧地址的结果一直累积）"""
+    cache_path = get_logo_cache_path()
+    cache = {logo_url: entry for logo_url, entry in cache.items()
+             if now - entry.get("checked_at", 0) < config.logo_cache_ttl}
+    try:
+        with open(cache_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(cache, f, ensure_ascii=False)
+        os.replace(cache_path + ".tmp", cache_path)
+    except Exception as e:
+        logging.error(f"写入台标检查缓存失败：{str(e)[:100]}")
+
+
+def get_logo_url(channel_name):
+    return config.logo_url_template.format(channel_name=channel_name)
+
+
+# 镜像文件名只保留字母、数字、汉字、"+"和"-"，其余字符（含"/"、"."）替换为"_"
+LOGO_FILE_NAME_PATTERN = re.compile(r"[^\w+\-]")
+
+
+def get_logo_file_name(channel_name):
+    """频道名对应的镜像文件名：含不安全字符时替换并追加频道名摘要（避免写出镜像目录，也避免替换后重名）"""
+    safe_name = LOGO_FILE_NAME_PATTERN.sub("_", channel_name)
+    if safe_name != channel_name or not safe_name:
+        safe_name += "_" + hashlib.sha1(channel_name.encode("utf-8")).hexdigest()[:8]
+    return f"{safe_name}.png"
+
+
+def check_logo_url(logo_url):
+    """HEAD请求台标地址：存在返回True，确定不存在（404/410）返回False，网络错误等无法判断时返回None"""
+    try:
+        response = get_http_session().head(logo_url, headers={'User-Agent': random.choice(USER_AGENT_POOL)},
+                                           timeout=config.logo_check_timeout, allow_redirects=True)
+    except requests.RequestException:
+        return None
+    if response.status_code == 200:
+        return True
+    if response.status_code in (404, 410):
+        return False
+    return None
+
+
+def mirror_logo(channel_name, logo_url):
+    """把台标下载到config.logo_mirror_dir（已存在时不重复下载），返回发布后的地址，失败返回None"""
+    file_name = get_logo_file_name(channel_name)
+    local_path = os.path.join(config.logo_mirror_dir, file_name)
+    if not os.path.exists(local_path):
+        try:
+            response = get_http_session().get(logo_url, headers={'User-Agent': random.choice(USER_AGENT_POOL)},
+                                              timeout=config.logo_check_timeout)
+            response.raise_for_status()
+            with open(local_path + ".tmp", "wb") as f:
+                f.write(response.content)
+            os.replace(local_path + ".tmp", local_path)
+        except Exception as e:
+            logging.warning(f"台标镜像下载失败：{channel_name}，错误：{str(e)[:100]}")
+            return None
+    return config.logo_public_base_url.rstrip("/") + "/" + quote(file_name)
+
+
+def resolve_channel_logos(channel_names):
+    """并发检查各频道台标是否存在（每个台标地址只检查一次，结果跨运行缓存），返回 频道名 → tvg-logo地址（None表示省略）
+
+    不存在时使用config.logo_fallback_url（未配置则省略）；无法判断（网络错误等）时保留原地址且不缓存。
+    """
+    logo_urls = {channel_name: get_logo_url(channel_name) for channel_name in channel_names}
+    cache = load_logo_cache()
+    now = time.time()
+    pending_urls = [logo_url for logo_url in dict.fromkeys(logo_urls.values())
+                    if now - cache.get(logo_url, {}).get("checked_at", 0) >= config.logo_cache_ttl]
+
+    if pending_urls:
+        start_time = time.time()
+        max_workers = max(1, min(config.logo_check_workers, len(pending_urls)))
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="logo") as executor:
+            for logo_url, exists in zip(pending_urls, executor.map(check_logo_url, pending_urls)):
+                if exists is None:
+                    cache.pop(logo_url, None)
+                else:
+                    cache[logo_url] = {"ok": exists, "checked_at": now}
+        save_logo_cache(cache, now)
+        logging.info(f"检查{len(pending_urls)}个频道台标（并发数：{max_workers}），耗时：{time.time() - start_time:.2f}秒")
+
+    mirror_enabled = bool(config.logo_mirror_dir and config.logo_public_base_url)
+    if mirror_enabled:
+        os.makedirs(config.logo_mirror_dir, exist_ok=True)
+
+    logos = {}
+    missing_count = 0
+    for channel_name, logo_url in logo_urls.items():
+        exists = cache.get(logo_url, {}).get("ok")
+        if exists is False:
+            logos[channel_name] = config.logo_fallback_url
+            missing_count += 1
+        elif exists and mirror_enabled:
+            logos[channel_name] = mirror_logo(channel_name, logo_url) or logo_url
+        else:
+            logos[channel_name] = logo_url
+    logging.info(f"台标：{len(logo_urls)}个频道，{missing_count}个不存在"
+                 f"（{'使用备用台标' if config.logo_fallback_url else '省略tvg-logo'}）")
+    return logos
+
+
+# -------------------------- 播放列表输出 --------------------------
+# 播放列表模型：生成一次，各输出格式在同一次遍历中各自拼接
+PlaylistGroup = namedtuple("PlaylistGroup", ["name", "entries"])
+PlaylistEntry = namedtuple("PlaylistEntry", ["name", "url", "logo", "tvg_id"])
+
+OUTPUT_EMITTERS = {}
+
+
+def register_output_emitter(format_name):
+    """注册输出格式（类装饰器）；config.output_formats 中在格式名后加 .gz 即输出其gzip压缩版本"""
+    def decorator(emitter_class):
+        OUTPUT_EMITTERS[format_name] = emitter_class
+        return emitter_class
+    return decorator
+
+
+class PlaylistEmitter:
+    """输出格式基类：遍历播放列表时依次收到分类和频道条目，遍历结束后取出完整文本"""
+
+    def __init__(self):
+        self.parts = []
+
+    def start_group(self, group):
+        pass
+
+    def add_entry(self, group, entry):
+        pass
+
+    def getvalue(self):
+        return "".join(self.parts)
+
+
+@register_output_emitter("m3u")
+class M3UEmitter(PlaylistEmitter):
+    """M3U：没有频道的分类不输出"""
+
+    def __init__(self):
+        super().__init__()
+        self.parts.append(f"""#EXTM3U x-tvg-url={",".join(f'"{epg_url}"' for epg_url in get_epg_header_urls())}\n""")
+
+    def add_entry(self, group, entry):
+        logo_attribute = f' tvg-logo="{entry.logo}"' if entry.logo else ""
+        self.parts.append(
+            f"""#EXTINF:-1 tvg-id="{entry.tvg_id}" tvg-name="{entry.name}"{logo_attribute} group-title="{group.name}",{entry.name}\n""")
+        self.parts.append(f"{entry.url}\n")
+
+
+@register_output_emitter("txt")
+class TXTEmitter(PlaylistEmitter):
+    """TXT：模板中的分类即使没有频道也保留分类行"""
+
+    def start_group(self, group):
+        self.parts.append(f"{group.name},#genre#\n")
+
+    def add_entry(self, group, entry):
+        self.parts.append(f"{entry.name},{entry.url}\n")
+
+    def getvalue(self):
+        return super().getvalue() + "\n"
+
+
+@register_output_emitter("json")
+class JSONEmitter(PlaylistEmitter):
+    """JSON索引：分类 → 频道 → 线路列表（同一频道的多条线路合并为一项）"""
+
+    def __init__(self):
+        super().__init__()
+        self.groups = []
+
+    def start_group(self, group):
+        self.groups.append({"name": group.name, "channels": []})
+
+    def add_entry(self, group, entry):
+        channels = self.groups[-1]["channels"]
+        if not channels or channels[-1]["name"] != entry.name:
+            channels.append({"name": entry.name, "logo": entry.logo, "urls": []})
+        channels[-1]["urls"].append(entry.url)
+
+    def getvalue(self):
+        return json.dumps({"groups": self.groups}, ensure_ascii=False, indent=1) + "\n"
+
+
+def build_playlist(channels, template_channels):
+    """按模板顺序生成播放列表模型（公告分类在前；线路去重、过滤黑名单并加线路后缀）"""
     written_urls = set()
+    playlist = []
 
     current_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     for group in config.announcements:
+        entries = []
         for announcement in group['entries']:
             if announcement['name'] is None:
                 announcement['name'] = current_date
+            entries.append(PlaylistEntry(announcement['name'], announcement['url'], announcement['logo'], 1))
+        playlist.append(PlaylistGroup(group['channel'], entries))
+
+    for category, channel_list in template_channels.items():
+        entries = []
+        if category in channels:
+            for channel_name in channel_list:
+                if channel_name in channels[category]:
+                    sorted_urls = sorted(channels[category][channel_name], key=lambda url: not is_ipv6(
+                        url) if config.ip_version_priority == "ipv6" else is_ipv6(url))
+                    filtered_urls = []
+                    for url in sorted_urls:
+                        if url and url not in written_urls and not is_url_blacklisted(url):
+                            filtered_urls.append(url)
+                            written_urls.add(url)
+
+                    total_urls = len(filtered_urls)
+                    logo_url = get_logo_url(channel_name)
+                    for index, url in enumerate(filtered_urls, start=1):
+                        if is_ipv6(url):
+                            url_suffix = f"$LR•IPV6" if total_urls == 1 else f"$LR•IPV6『线路{index}』"
+                        else:
+                            url_suffix = f"$LR•IPV4" if total_urls == 1 else f"$LR•IPV4『线路{index}』"
+                        if '$' in url:
+                            base_url = url.split('$', 1)[0]
+                        else:
+                            base_url = url
+
+                        entries.append(PlaylistEntry(channel_name, f"{base_url}{url_suffix}", logo_url, index))
+        playlist.append(PlaylistGroup(category, entries))
+
+    if config.logo_check_enabled:
+        announcement_count = len(config.announcements)
+        logos = resolve_channel_logos(entry.name for group in playlist[announcement_count:] for entry in group.entries)
+        playlist[announcement_count:] = [
+            PlaylistGroup(group.name, [entry._replace(logo=logos[entry.name]) for entry in group.entries])
+            for group in playlist[announcement_count:]
+        ]
+
+    return playlist
+
+
+def write_playlist_outputs(playlist, output_prefix="live", output_formats=None):
+    """单次遍历播放列表，同时生成所有输出格式并写入 {output_prefix}.{格式}，返回是否有文件变化"""
+    output_formats = output_formats or config.output_formats
+    base_formats = list(dict.fromkeys(output_format.removesuffix(".gz") for output_format in output_formats))
+    unknown_formats = [output_format for output_format in base_formats if output_format not in OUTPUT_EMITTERS]
+    if unknown_formats:
+        raise ValueError(f"不支持的输出格式：{unknown_formats}，可选：{list(OUTPUT_EMITTERS)}（可加.gz后缀）")
+
+    emitters = [OUTPUT_EMITTERS[output_format]() for output_format in base_formats]
+    for group in playlist:
+        for emitter in emitters:
+            emitter.start_group(group)
+        for entry in group.entries:
+            for emitter in emitters:
+                emitter.add_entry(group, entry)
+
+    contents = {output_format: emitter.getvalue() for output_format, emitter in zip(base_formats, emitters)}
+    changed = False
+    for output_format in output_formats:
+        compress = output_format.endswith(".gz")
+        content = contents[output_format.removesuffix(".gz")]
+        changed = write_output_if_changed(f"{output_prefix}.{output_format}", content, compress) or changed
+    return changed
+
+
+def updateChannelUrlsM3U(channels, template_channels, output_prefix="live"):
+    """保留代码1的M3U/TXT生成功能（按config.output_formats输出到 {output_prefix}.m3u / {output_prefix}.txt 等），返回输出文件是否有变化"""
+    return write_playlist_outputs(build_playlist(channels, template_channels), output_prefix)
+
+
+# -------------------------- EPG节目单 --------------------------
+EPG_GZIP_MAGIC = b"\x1f\x8b"
+EPG_STORE_BATCH_SIZE = 500
+
+
+def get_epg_header_urls():
+    """M3U头x-tvg-url引用的节目单：配置了合并节目单的公开地址时只引用它，否则引用原始的config.epg_urls"""
+    return [config.epg_public_url] if config.epg_public_url else config.epg_urls
 
-    with open("live.m3u", "w", encoding="utf-8") as f_m3u:
-        f_m3u.write(f"""#EXTM3U x-tvg-url={",".join(f'"{epg_url}"' for epg_url in config.epg_urls)}\n""")
-
-        with open("live.txt", "w", encoding="utf-8") as f_txt:
-            for group in config.announcements:
-                f_txt.write(f"{group['channel']},#genre#\n")
-                for announcement in group['entries']:
-                    f_m3u.write(
-                        f"""#EXTINF:-1 tvg-id="1" tvg-name="{announcement['name']}" tvg-logo="{announcement['logo']}" group-title="{group['channel']}",{announcement['name']}\n""")
-                    f_m3u.write(f"{announcement['url']}\n")
-                    f_txt.write(f"{announcement['name']},{announcement['url']}\n")
-
-            for category, channel_list in template_channels.items():
-                f_txt.write(f"{category},#genre#\n")
-                if category in channels:
-                    for channel_name in channel_list:
-                        if channel_name in channels[category]:
-                            sorted_urls = sorted(channels[category][channel_name], key=lambda url: not is_ipv6(
-                                url) if config.ip_version_priority == "ipv6" else is_ipv6(url))
-                            filtered_urls = []
-                            for url in sorted_urls:
-                                if url and url not in written_urls and not any(
-                                        blacklist in url for blacklist in config.url_blacklist):
-                                    filtered_urls.append(url)
-                                    written_urls.add(url)
-
-                            total_urls = len(filtered_urls)
-                            for index, url in enumerate(filtered_urls, start=1):
-                                if is_ipv6(url):
-                                    url_suffix = f"$LR•IPV6" if total_urls == 1 else f"$LR•IPV6『线路{index}』"
-                                else:
-                                    url_suffix = f"$LR•IPV4" if total_urls == 1 else f"$LR•IPV4『线路{index}』"
-                                if '$' in url:
-                                    base_url = url.split('$', 1)[0]
-                                else:
-                                    base_url = url
-
-                                new_url = f"{base_url}{url_suffix}"
-
-                                f_m3u.write(
-                                    f"#EXTINF:-1 tvg-id=\"{index}\" tvg-name=\"{channel_name}\" tvg-logo=\"https://gcore.jsdelivr.net/gh/yuanzl77/TVlogo@master/png/{channel_name}.png\" group-title=\"{category}\",{channel_name}\n")
-                                f_m3u.write(new_url + "\n")
-                                f_txt.write(f"{channel_name},{new_url}\n")
-
-            f_txt.write("\n")
+
+def iter_epg_chunks(response):
+    """逐块产出节目单的XML字节（按gzip魔数自动解压 .gz 节目单）"""
+    decompressor = None
+    for index, chunk in enumerate(response.iter_content(chunk_size=STREAM_CHUNK_SIZE)):
+        if index == 0 and chunk.startswith(EPG_GZIP_MAGIC):
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        yield decompressor.decompress(chunk) if decompressor else chunk
+
+
+def iter_epg_elements(chunks):
+    """增量解析XMLTV，逐个产出顶层的<channel>/<programme>元素（产出后即从根节点移除，内存占用与节目单大小无关）"""
+    parser = ElementTree.XMLPullParser(events=("start", "end"))
+    root = None
+    for chunk in itertools.chain(chunks, [None]):
+        if chunk is None:
+            parser.close()
+        else:
+            parser.feed(chunk)
+        for event, element in parser.read_events():
+            if root is None:
+                root = element
+            elif event == "end" and element.tag in ("channel", "programme"):
+                yield element
+                root.clear()
+
+
+def build_epg_channel_keys(template_channels):
+    """模板频道的匹配键 → 模板频道名（开启模糊匹配时与频道匹配一样按规范化名称）"""
+    key_func = normalize_channel_name if config.fuzzy_channel_match else None
+    channel_keys = {}
+    for channel_list in template_channels.values():
+        for channel_name in channel_list:
+            channel_keys.setdefault(key_func(channel_name) if key_func else channel_name, channel_name)
+    return channel_keys, key_func
+
+
+def parse_xmltv_time(value):
+    """解析XMLTV时间（如 20261018190000 +0800），返回Unix时间戳；没有时区时按XMLTV约定视为UTC，无法解析返回None"""
+    value = (value or "").replace(" ", "")
+    try:
+        if len(value) > 14:
+            return int(datetime.strptime(value, "%Y%m%d%H%M%S%z").timestamp())
+        return int(datetime.strptime(value, "%Y%m%d%H%M%S").replace(tzinfo=timezone.utc).timestamp())
+    except ValueError:
+        return None
+
+
+def open_epg_store():
+    """打开节目单存储（SQLite，位于缓存目录）：各节目单的校验信息，以及按(节目单, 频道, 开始时间)存放的节目"""
+    os.makedirs(config.cache_dir, exist_ok=True)
+    connection = sqlite3.connect(os.path.join(config.cache_dir, "epg.sqlite3"))
+    connection.executescript("""
+        CREATE TABLE IF NOT EXISTS epg_feeds (
+            url TEXT PRIMARY KEY,
+            etag TEXT,
+            last_modified TEXT,
+            template_digest TEXT,
+            fetched_at REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS epg_programmes (
+            feed_url TEXT NOT NULL,
+            channel TEXT NOT NULL,
+            start_ts INTEGER NOT NULL,
+            stop_ts INTEGER NOT NULL,
+            xml TEXT NOT NULL,
+            PRIMARY KEY (feed_url, channel, start_ts)
+        );
+    """)
+    return connection
+
+
+def get_epg_template_digest(channel_keys):
+    """模板频道集合的摘要：模板变化后需重新完整解析各节目单（条件请求返回304时拿不到新增频道的节目）"""
+    return hashlib.sha1("\n".join(sorted(channel_keys)).encode("utf-8")).hexdigest()
+
+
+def update_epg_feed(connection, epg_url, channel_keys, key_func, now):
+    """条件请求单个节目单：未修改时沿用存储；有更新时流式解析模板频道的节目，按(频道, 开始时间)合并进存储。
+    返回本次写入的节目数（未修改时为None）"""
+    template_digest = get_epg_template_digest(channel_keys)
+    headers = {'User-Agent': random.choice(USER_AGENT_POOL), 'Accept-Encoding': 'gzip, deflate'}
+    feed = connection.execute("SELECT etag, last_modified, template_digest FROM epg_feeds WHERE url = ?",
+                              (epg_url,)).fetchone()
+    if feed and feed[2] == template_digest:
+        if feed[0]:
+            headers['If-None-Match'] = feed[0]
+        if feed[1]:
+            headers['If-Modified-Since'] = feed[1]
+
+    with get_http_session().get(epg_url, headers=headers, timeout=(10, 60), stream=True) as response:
+        if response.status_code == 304:
+            with connection:
+                connection.execute("UPDATE epg_feeds SET fetched_at = ? WHERE url = ?", (now, epg_url))
+            return None
+        response.raise_for_status()
+
+        # 新解析的节目先写入临时表，整个节目单解析成功后再一次性合并
+        connection.execute("""
+            CREATE TEMP TABLE IF NOT EXISTS epg_new (channel TEXT, start_ts INTEGER, stop_ts INTEGER, xml TEXT)
+        """)
+        connection.execute("DELETE FROM epg_new")
+        window_start = now - config.epg_keep_past
+        feed_channels = {}
+        batch = []
+        programme_count = 0
+        for element in iter_epg_elements(iter_epg_chunks(response)):
+            if element.tag == "channel":
+                for display_name in element.iter("display-name"):
+                    name = (display_name.text or "").strip()
+                    channel_name = channel_keys.get(key_func(name) if key_func else name)
+                    if channel_name and channel_name not in feed_channels.values():
+                        feed_channels[element.get("id")] = channel_name
+                        break
+            elif element.get("channel") in feed_channels:
+                start_ts = parse_xmltv_time(element.get("start"))
+                stop_ts = parse_xmltv_time(element.get("stop")) or start_ts
+                if start_ts is None or stop_ts < window_start:
+                    continue
+                channel_name = feed_channels[element.get("channel")]
+                element.set("channel", channel_name)
+                element.tail = None
+                batch.append((channel_name, start_ts, stop_ts, ElementTree.tostring(element, encoding="unicode")))
+                if len(batch) >= EPG_STORE_BATCH_SIZE:
+                    connection.executemany("INSERT INTO epg_new VALUES (?, ?, ?, ?)", batch)
+                    programme_count += len(batch)
+                    batch.clear()
+        connection.executemany("INSERT INTO epg_new VALUES (?, ?, ?, ?)", batch)
+        programme_count += len(batch)
+
+        with connection:
+            # 每个频道以本次节目单中最早的开始时间为界：与之重叠及之后的旧节目以新数据为准（节目调整后不残留），之前的历史保留
+            connection.execute("""
+                DELETE FROM epg_programmes WHERE feed_url = ? AND stop_ts > (
+                    SELECT MIN(start_ts) FROM epg_new WHERE epg_new.channel = epg_programmes.channel)
+            """, (epg_url,))
+            connection.execute("""
+                INSERT OR REPLACE INTO epg_programmes (feed_url, channel, start_ts, stop_ts, xml)
+                SELECT ?, channel, start_ts, stop_ts, xml FROM epg_new
+            """, (epg_url,))
+            connection.execute("""
+                INSERT OR REPLACE INTO epg_feeds (url, etag, last_modified, template_digest, fetched_at)
+                VALUES (?, ?, ?, ?, ?)
+            """, (epg_url, response.headers.get("ETag"), response.headers.get("Last-Modified"), template_digest, now))
+            connection.execute("DELETE FROM epg_new")
+    return programme_count
+
+
+def prune_epg_store(connection, now):
+    """删除窗口之外的节目，以及已从config.epg_urls移除的节目单的数据"""
+    feed_placeholders = ",".join("?" * len(config.epg_urls))
+    with connection:
+        pruned = connection.execute("DELETE FROM epg_programmes WHERE stop_ts < ?",
+                                    (now - config.epg_keep_past,)).rowcount
+        pruned += connection.execute(f"DELETE FROM epg_programmes WHERE feed_url NOT IN ({feed_placeholders})",
+                                     config.epg_urls).rowcount
+        connection.execute(f"DELETE FROM epg_feeds WHERE url NOT IN ({feed_placeholders})", config.epg_urls)
+    return pruned
+
+
+def write_epg_file(output_file, template_channels, connection):
+    """从存储写出合并后的XMLTV（gzip压缩，mtime固定为0）：每个模板频道取config.epg_urls中最靠前的有节目的节目单，
+    频道按模板顺序、节目按开始时间排列；内容不变时不替换原文件。返回 (是否写入, 覆盖的频道数)"""
+    feed_ranks = {epg_url: rank for rank, epg_url in enumerate(config.epg_urls)}
+    channel_feeds = {}
+    for feed_url, channel_name in connection.execute("SELECT DISTINCT feed_url, channel FROM epg_programmes"):
+        if feed_url in feed_ranks and (channel_name not in channel_feeds
+                                       or feed_ranks[feed_url] < feed_ranks[channel_feeds[channel_name]]):
+            channel_feeds[channel_name] = feed_url
+    if not channel_feeds:
+        logging.warning("节目单存储中没有模板频道的节目，保留现有节目单文件")
+        return False, 0
+
+    channel_names = [channel_name for channel_name in dict.fromkeys(
+        channel_name for channel_list in template_channels.values() for channel_name in channel_list
+    ) if channel_name in channel_feeds]
+
+    tmp_file = output_file + ".tmp"
+    with open(tmp_file, "wb") as raw_file:
+        with gzip.GzipFile(filename="", fileobj=raw_file, mode="wb", mtime=0) as gzip_file:
+            with io.TextIOWrapper(gzip_file, encoding="utf-8") as f:
+                f.write('<?xml version="1.0" encoding="UTF-8"?>\n<tv generator-info-name="live-epg">\n')
+                for channel_name in channel_names:
+                    f.write(f'<channel id={quoteattr(channel_name)}><display-name lang="zh">'
+                            f'{escape(channel_name)}</display-name></channel>\n')
+                for channel_name in channel_names:
+                    for (programme_xml,) in connection.execute(
+                            "SELECT xml FROM epg_programmes WHERE feed_url = ? AND channel = ? ORDER BY start_ts",
+                            (channel_feeds[channel_name], channel_name)):
+                        f.write(programme_xml)
+                        f.write("\n")
+                f.write("</tv>\n")
+
+    if os.path.exists(output_file) and get_gzip_file_digest(output_file) == get_gzip_file_digest(tmp_file):
+        os.remove(tmp_file)
+        logging.info(f"{output_file} 内容未变化，跳过写入")
+        return False, len(channel_names)
+    os.replace(tmp_file, output_file)
+    logging.info(f"{output_file} 已更新")
+    return True, len(channel_names)
+
+
+def get_gzip_file_digest(gzip_path):
+    """gzip文件解压后内容的摘要（分块读取）"""
+    digest = hashlib.sha256()
+    try:
+        with gzip.open(gzip_path, "rb") as f:
+            for chunk in iter(lambda: f.read(STREAM_CHUNK_SIZE), b""):
+                digest.update(chunk)
+    except (OSError, EOFError) as e:
+        logging.warning(f"读取gzip文件失败：{gzip_path}，错误：{str(e)[:100]}")
+        return None
+    return digest.hexdigest()
+
+
+def update_epg(template_channels, output_file=None):
+    """EPG阶段：逐个条件请求config.epg_urls并增量更新节目单存储，再从存储输出只含模板频道的gzip压缩XMLTV；返回文件是否变化"""
+    if not config.epg_enabled:
+        return False
+
+    output_file = output_file or config.epg_output_file
+    channel_keys, key_func = build_epg_channel_keys(template_channels)
+    start_time = time.time()
+    now = time.time()
+
+    connection = open_epg_store()
+    try:
+        for epg_url in config.epg_urls:
+            try:
+                programme_count = update_epg_feed(connection, epg_url, channel_keys, key_func, now)
+            except Exception as e:
+                connection.rollback()
+                logging.error(f"节目单下载或解析失败，沿用已存储的节目：{epg_url}，错误：{str(e)[:150]}")
+                continue
+            if programme_count is None:
+                logging.info(f"节目单 {epg_url} 未修改（304），沿用已存储的节目")
+            else:
+                logging.info(f"节目单 {epg_url} 已更新：{programme_count}条模板频道节目")
+
+        pruned = prune_epg_store(connection, now)
+        changed, channel_count = write_epg_file(output_file, template_channels, connection)
+    finally:
+        connection.close()
+
+    logging.info(f"EPG更新完成：覆盖{channel_count}/{len(channel_keys)}个模板频道，清理过期节目{pruned}条，"
+                 f"耗时：{time.time() - start_time:.2f}秒")
+    return changed
+
+
+# -------------------------- 多省份批量模式 --------------------------
+def init_batch_worker():
+    """批量模式子进程初始化：丢弃从父进程继承的HTTP连接池和缓存索引，退出时关闭本进程的浏览器池"""
+    global _http_session, _http_cache_index
+    _http_session = None
+    _http_cache_index = None
+    # spawn方式启动的子进程不继承日志配置，以追加方式写同一日志文件（fork方式已继承，此调用不生效）
+    setup_logging(mode="a")
+    # 进程池子进程以os._exit退出不会执行atexit，需注册为multiprocessing的退出回调
+    multiprocessing.util.Finalize(None, close_browser_pool, exitpriority=10)
+
+
+def run_province_job(province_input, template_file, static_channels):
+    """批量模式单个省份任务：抓取动态源、匹配并输出到 live_<value>.txt / live_<value>.m3u，返回(省份名, 耗时, 输出是否变化)"""
+    province_value, province_name = validate_province(province_input)
+    start_time = time.time()
+    channels, template_channels = filter_source_urls(template_file, province_input, static_channels,
+                                                     storage_key=province_value)
+    changed = updateChannelUrlsM3U(channels, template_channels, f"live_{province_value}")
+    return province_name, time.time() - start_time, changed
+
+
+def run_batch(provinces, template_file, max_workers=None):
+    """多省份批量模式：config源只抓取一次，各省份在进程池中并行处理；返回(各省份是否成功, 是否有输出文件变化)"""
+    provinces = [validate_province(province)[1] for province in provinces]
+    max_workers = max(1, min(max_workers or config.batch_max_workers, len(provinces)))
+    start_time = time.time()
+    logging.info(f"批量模式：{len(provinces)}个省份（{'、'.join(provinces)}），并行进程数：{max_workers}")
+
+    static_channels = fetch_all_channels(config.source_urls)
+
+    results = OrderedDict()
+    outputs_changed = False
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=init_batch_worker) as executor:
+        futures = OrderedDict(
+            (province, executor.submit(run_province_job, province, template_file, static_channels))
+            for province in provinces
+        )
+        for province, future in futures.items():
+            try:
+                _, elapsed, changed = future.result()
+                results[province] = True
+                outputs_changed = outputs_changed or changed
+                logging.info(f"省份 {province} 处理完成，耗时：{elapsed:.2f}秒{'' if changed else '（输出无变化）'}")
+            except Exception as e:
+                results[province] = False
+                logging.error(f"省份 {province} 处理失败：{str(e)[:200]}")
+
+    logging.info(f"批量模式完成：成功{sum(results.values())}/{len(results)}个省份，总耗时：{time.time() - start_time:.2f}秒")
+    return results, outputs_changed
 
 
 # -------------------------- 主函数（支持省份输入） --------------------------
 if __name__ == "__main__":
+    template_file = "demo.txt"
+    setup_logging()
+
+    # 静态源模式：python main.py --static（只处理config.source_urls，不启动浏览器）
+    if len(sys.argv) >= 2 and sys.argv[1] == "--static":
+        try:
+            channels, template_channels = filter_source_urls(template_file, static_only=True)
+            outputs_changed = updateChannelUrlsM3U(channels, template_channels)
+            report_output_changed(update_epg(template_channels) or outputs_changed)
+            print("\n🎉 静态源流程执行完成，已生成 live.m3u 和 live.txt 文件")
+        except Exception as e:
+            logging.error(f"静态源流程执行失败：{e}")
+            print(f"\n❌ 静态源流程执行失败：{e}")
+            sys.exit(1)
+        sys.exit(0)
+
+    # 节目单模式：python main.py --epg（只重新生成合并节目单，需开启config.epg_enabled）
+    if len(sys.argv) >= 2 and sys.argv[1] == "--epg":
+        try:
+            report_output_changed(update_epg(parse_template(template_file)))
+            print(f"\n🎉 节目单流程执行完成：{config.epg_output_file}")
+        except Exception as e:
+            logging.error(f"节目单流程执行失败：{e}")
+            print(f"\n❌ 节目单流程执行失败：{e}")
+            sys.exit(1)
+        sys.exit(0)
+
+    # 执行初始化清理
+    init_clean_invalid_files()
+
+    # 批量模式：python main.py --batch [省份1 省份2 ...]（未指定省份时使用config.batch_provinces）
+    if len(sys.argv) >= 2 and sys.argv[1] == "--batch":
+        batch_provinces = sys.argv[2:] or config.batch_provinces
+        try:
+            batch_results, batch_changed = run_batch(batch_provinces, template_file)
+            report_output_changed(update_epg(parse_template(template_file)) or batch_changed)
+            success_count = sum(batch_results.values())
+            print(f"\n🎉 批量流程执行完成，成功{success_count}/{len(batch_results)}个省份")
+        except Exception as e:
+            logging.error(f"批量流程执行失败：{e}")
+            print(f"\n❌ 批量流程执行失败：{e}")
+            sys.exit(1)
+        # 没有任何省份成功时以非零状态退出，让调度方（如GitHub Actions）感知失败
+        sys.exit(0 if success_count else 1)
+
     # 处理省份参数（命令行传入或默认海南）
     target_province = "海南"
     if len(sys.argv) >= 2:
         target_province = sys.argv[1]
         print(f"📌 接收到省份参数：{target_province}")
 
-    template_file = "demo.txt"
     try:
         channels, template_channels = filter_source_urls(template_file, target_province)
-        updateChannelUrlsM3U(channels, template_channels)
+        outputs_changed = updateChannelUrlsM3U(channels, template_channels)
+        report_output_changed(update_epg(template_channels) or outputs_changed)
         print("\n🎉 全部流程执行完成，已生成 live.m3u 和 live.txt 文件")
     except Exception as e:
         logging.error(f"主流程执行失败：{e}")
-        print(f"\n❌ 主流程执行失败：{e}")
\ No newline at end of file
+        print(f"\n❌ 主流程执行失败：{e}")
+    finally:
+        close_browser_pool()
\ No newline at end of file
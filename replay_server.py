@@ -0,0 +1,557 @@
+"""离线回放：本地替身站点 + 替身udpxy主机
+
+替身站点模拟组播源站点的完整流程：首页验证（无验证Cookie时返回设置Cookie并刷新的验证页）、省份选择、
+组播源列表页、IP详情页（"IP详情: x" + 真实ip:端口）、format=txt频道列表、台标和节目单；
+每个替身udpxy主机在127.0.0.1的独立端口上输出假的TS流（188字节、0x47同步字节的包）。
+页面和流都可配置延迟与失败率，失败按(种子, 路径, 第几次请求)确定，同样的参数每次运行结果一致。
+
+用法：
+    python replay_server.py serve [选项]                      只启动替身服务，打印需要覆盖的config项
+    python replay_server.py run [选项] [-- main.py参数 ...]   启动替身服务，在临时目录中按 __main__ 流程运行main.py并计时
+    python replay_server.py probe-check                       用替身主机校验线路探测：TS流（含chunked）判为可用，
+                                                              HTML页面/404/无法连接判为不可用，结果不符时退出码为1
+        例：python replay_server.py run --runs 2 -- 湖南
+            python replay_server.py run --skip-browser --probe -- --batch 海南 湖南
+
+常用选项：
+    --record-dir 目录      优先使用录制的页面/频道列表：home.html、list_<省份value>.html、detail_<组播IP>.html、
+                           channels.txt（组播频道列表）、hotel.txt（config源频道列表）；其中的ip:端口和流地址主机
+                           会改写为替身udpxy主机。未录制时频道列表使用仓库中的live.txt/live_hn.txt
+    --hosts N              每个省份的组播IP数（默认8），其中 --dead-hosts 个解析到无法连接的端口（默认2）
+    --delay 秒             站点页面响应延迟；--failure-rate 站点页面返回503的比例
+    --stream-delay 秒      TS流首字节延迟；--stream-failure-rate TS流返回503的比例；--stream-rate 每秒字节数（0不限速）
+    --stream-mode 模式     替身udpxy主机的响应：ts（默认）、chunked（分块传输的TS流）、html（返回200的认证门户页）
+    --skip-browser         预先写入组播IP解析缓存，跳过浏览器阶段（无Chromium时测量其余流程）
+    --probe                开启线路探测（config.probe_enabled），探测替身udpxy主机的TS流
+"""
+import argparse
+import asyncio
+import copy
+import functools
+import hashlib
+import http.server
+import os
+import re
+import runpy
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from html import escape
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import config
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+TS_PACKET = b"\x47" + b"\x1f\xff\x10" + b"\xff" * 184
+# chunked模式的分块长度（不是188的倍数，按原始字节读取时分块头会打乱同步字节的位置）
+STREAM_CHUNKED_SIZE = 100
+PORTAL_PAGE = "<html><head><title>认证</title></head><body><h1>请登录后使用网络</h1></body></html>"
+IP_PORT_PATTERN = re.compile(r"(?:\d{1,3}\.){3}\d{1,3}:\d+")
+STREAM_HOST_PATTERN = re.compile(r"(https?://)(\[[0-9a-fA-F:]+\]|[^/:\s]+):\d+/")
+VERIFY_COOKIE_PREFIX = "87eb4da0dd394d53"
+DEFAULT_AREAS = ["城区", "郊区", "开发区", "新区"]
+
+
+def get_free_port():
+    """取一个当前未被占用的端口（用于无法连接的替身主机：端口关闭后不再监听）"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class ReplayState:
+    """替身服务共享状态：参数、替身udpxy主机、各省份的组播IP表及请求计数"""
+
+    def __init__(self, args):
+        self.args = args
+        self.lock = threading.Lock()
+        self.request_counts = Counter()
+        self.route_counts = Counter()
+        self.servers = []
+        self.base_url = None
+        self.provinces = {}
+        self.hotel_host = None
+
+    def should_fail(self, rate, path):
+        """按(种子, 路径, 第几次请求)确定是否注入失败，重试同一路径可能成功，且每次运行结果一致"""
+        if rate <= 0:
+            return False
+        with self.lock:
+            self.request_counts[path] += 1
+            attempt = self.request_counts[path]
+        digest = hashlib.sha256(f"{self.args.seed}|{path}|{attempt}".encode("utf-8")).digest()
+        return int.from_bytes(digest[:4], "big") / 2 ** 32 < rate
+
+    def count_route(self, route):
+        with self.lock:
+            self.route_counts[route] += 1
+
+    def read_recorded(self, file_name, fallback_path=None):
+        """读取录制文件（--record-dir中），不存在时读取fallback_path，都不存在返回None"""
+        for path in (os.path.join(self.args.record_dir, file_name) if self.args.record_dir else None, fallback_path):
+            if path and os.path.exists(path):
+                with open(path, "r", encoding="utf-8") as f:
+                    return f.read()
+        return None
+
+
+def start_server(handler_class, state):
+    handler = functools.partial(handler_class, state)
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    state.servers.append(server)
+    return server.server_address[1]
+
+
+class StreamHandler(http.server.BaseHTTPRequestHandler):
+    """替身udpxy主机：/rtp/、/udp/ 下的任意地址都输出假的TS流（--stream-mode为html时返回认证门户页）"""
+    protocol_version = "HTTP/1.0"
+
+    def __init__(self, state, *args, **kwargs):
+        self.state = state
+        super().__init__(*args, **kwargs)
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        args = self.state.args
+        self.state.count_route("stream")
+        if not self.path.startswith(("/rtp/", "/udp/")):
+            self.send_error(404)
+            return
+        if self.state.should_fail(args.stream_failure_rate, f"{self.server.server_address[1]}{self.path}"):
+            self.send_error(503)
+            return
+        time.sleep(args.stream_delay)
+        if args.stream_mode == "html":
+            body = PORTAL_PAGE.encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        chunked = args.stream_mode == "chunked"
+        if chunked:
+            # 分块传输需要HTTP/1.1响应行；写完后关闭连接
+            self.protocol_version = "HTTP/1.1"
+            self.close_connection = True
+        self.send_response(200)
+        self.send_header("Content-Type", "video/mp2t")
+        if chunked:
+            self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        chunk = TS_PACKET * 348  # 约64KB
+        sent = 0
+        start_time = time.perf_counter()
+        try:
+            while sent < args.stream_bytes:
+                if chunked:
+                    for offset in range(0, len(chunk), STREAM_CHUNKED_SIZE):
+                        piece = chunk[offset:offset + STREAM_CHUNKED_SIZE]
+                        self.wfile.write(f"{len(piece):x}\r\n".encode("ascii") + piece + b"\r\n")
+                else:
+                    self.wfile.write(chunk)
+                sent += len(chunk)
+                if args.stream_rate > 0:
+                    ahead = sent / args.stream_rate - (time.perf_counter() - start_time)
+                    if ahead > 0:
+                        time.sleep(ahead)
+            if chunked:
+                self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+class SiteHandler(http.server.BaseHTTPRequestHandler):
+    """替身组播源站点"""
+    protocol_version = "HTTP/1.1"
+
+    def __init__(self, state, *args, **kwargs):
+        self.state = state
+        super().__init__(*args, **kwargs)
+
+    def log_message(self, *args):
+        pass
+
+    def send_body(self, body, content_type="text/html; charset=utf-8", status=200):
+        body = body.encode("utf-8") if isinstance(body, str) else body
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def is_verified(self):
+        return "list_js_verified=" in (self.headers.get("Cookie") or "")
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_GET(self):
+        args = self.state.args
+        parts = urlsplit(self.path)
+        query = {key: values[0] for key, values in parse_qs(parts.query).items()}
+        if self.state.should_fail(args.failure_rate, self.path):
+            self.state.count_route("failure")
+            self.send_body("Service Unavailable", "text/plain; charset=utf-8", 503)
+            return
+        time.sleep(args.delay)
+
+        if parts.path.startswith("/logos/"):
+            self.handle_logo(unquote(parts.path[len("/logos/"):]))
+        elif parts.path == "/e.xml":
+            self.handle_epg()
+        elif parts.path != "/":
+            self.send_body("Not Found", "text/plain; charset=utf-8", 404)
+        elif query.get("format") == "txt" and "s" in query:
+            self.handle_channel_list(query["s"], query.get("t"))
+        elif not self.is_verified():
+            self.handle_unverified(query)
+        elif "ip" in query:
+            self.handle_detail(query["ip"], query.get("p", ""))
+        elif "p" in query:
+            self.handle_list(query["p"])
+        else:
+            self.handle_home()
+
+    def handle_unverified(self, query):
+        """无验证Cookie：首页返回设置Cookie后刷新的验证页，其余页面返回"请从首页重新进入"提示"""
+        self.state.count_route("verify")
+        if query:
+            self.send_body('<html><body><h1 style="color:red">请从首页重新进入。</h1></body></html>')
+            return
+        self.send_body(
+            "<html><head><title>验证中</title></head><body><p>正在验证浏览器...</p>"
+            f"<script>var c = '{VERIFY_COOKIE_PREFIX}' + '_' + Date.now();"
+            "document.cookie = 'list_js_verified=' + c + '; path=/; max-age=1800';"
+            "setTimeout(function () { location.reload(); }, 200);</script></body></html>")
+
+    def handle_home(self):
+        self.state.count_route("home")
+        recorded = self.state.read_recorded("home.html")
+        if recorded:
+            self.send_body(recorded)
+            return
+        options = "".join(f'<option value="{value}">{escape(name)}</option>'
+                          for name, value in sorted(self.state.provinces_mapping.items(), key=lambda item: item[1]))
+        self.send_body(
+            "<html><head><meta charset=\"utf-8\"><title>IPTV组播源</title></head><body>"
+            "<h2>选择省份</h2>"
+            f'<select id="provinceSelect"><option value="">请选择</option>{options}</select>'
+            "<script>document.getElementById('provinceSelect').addEventListener('change', function () {"
+            "if (this.value) { location.href = '/?p=' + this.value; } });</script></body></html>")
+
+    def handle_list(self, province_value):
+        self.state.count_route("list")
+        recorded = self.state.read_recorded(f"list_{province_value}.html")
+        if recorded:
+            self.send_body(recorded)
+            return
+        rows = []
+        for entry in self.state.get_province(province_value):
+            rows.append(
+                f'<tr><td data-label="IP:"><a class="ip-link" href="/?ip={entry["ip"]}&p={province_value}">'
+                f'{entry["ip"]}</a></td>'
+                f'<td data-label="状态:"><span class="status-badge">{entry["status"]}</span></td>'
+                f'<td data-label="类型:">{escape(entry["type"])}</td></tr>')
+        self.send_body(
+            '<html><head><meta charset="utf-8"><title>组播源</title></head><body>'
+            '<section aria-label="组播源列表"><table class="iptv-table">'
+            '<thead><tr><th>IP</th><th>状态</th><th>类型</th></tr></thead>'
+            f'<tbody>{"".join(rows)}</tbody></table></section></body></html>')
+
+    def handle_detail(self, multicast_ip, province_value):
+        self.state.count_route("detail")
+        entry = next((item for item in self.state.get_province(province_value) if item["ip"] == multicast_ip), None)
+        if entry is None:
+            self.send_body("Not Found", "text/plain; charset=utf-8", 404)
+            return
+        ip_port = f"127.0.0.1:{entry['port']}"
+        recorded = self.state.read_recorded(f"detail_{multicast_ip}.html")
+        if recorded:
+            self.send_body(IP_PORT_PATTERN.sub(ip_port, recorded))
+            return
+        # 真实ip:端口只出现在Meta标签中，页面其余部分不含ip:端口
+        self.send_body(
+            f'<html><head><meta charset="utf-8"><title>IP详情: {multicast_ip}</title>'
+            f'<meta name="description" content="{ip_port}"></head>'
+            f'<body><h1>IP详情: {multicast_ip}</h1><p>类型：{escape(entry["type"])}</p></body></html>')
+
+    def handle_channel_list(self, ip_port, source_type):
+        """频道列表：录制的列表中所有流地址的主机改写为请求的替身主机（config源改写为酒店替身主机）"""
+        self.state.count_route("channels")
+        if source_type == "hotel":
+            content = self.state.read_recorded("hotel.txt", os.path.join(REPO_DIR, "live_hn.txt"))
+            ip_port = f"127.0.0.1:{self.state.hotel_host}"
+        else:
+            content = self.state.read_recorded("channels.txt", os.path.join(REPO_DIR, "live.txt"))
+        self.send_body(STREAM_HOST_PATTERN.sub(lambda match: f"http://{ip_port}/", content or ""),
+                       "text/plain; charset=utf-8")
+
+    def handle_logo(self, file_name):
+        """台标：按频道名确定约10%不存在"""
+        self.state.count_route("logo")
+        digest = hashlib.sha256(f"{self.state.args.seed}|{file_name}".encode("utf-8")).digest()
+        if digest[0] < 26:
+            self.send_body("Not Found", "text/plain; charset=utf-8", 404)
+        else:
+            self.send_body(b"\x89PNG\r\n\x1a\n" + digest, "image/png")
+
+    def handle_epg(self):
+        """节目单：模板中每个频道一天24个整点节目"""
+        self.state.count_route("epg")
+        day_start = datetime.now().replace(minute=0, second=0, microsecond=0) - timedelta(hours=2)
+        parts = ['<?xml version="1.0" encoding="UTF-8"?>\n<tv>\n']
+        channel_names = self.state.template_channel_names
+        for channel_name in channel_names:
+            parts.append(f'<channel id="{escape(channel_name)}"><display-name>{escape(channel_name)}'
+                         f'</display-name></channel>\n')
+        for channel_name in channel_names:
+            for hour in range(24):
+                start = day_start + timedelta(hours=hour)
+                parts.append(f'<programme channel="{escape(channel_name)}" start="{start:%Y%m%d%H%M%S} +0800" '
+                             f'stop="{start + timedelta(hours=1):%Y%m%d%H%M%S} +0800">'
+                             f'<title>节目{hour + 1}</title></programme>\n')
+        parts.append("</tv>\n")
+        self.send_body("".join(parts), "application/xml; charset=utf-8")
+
+
+def build_province_entries(state, province_value, province_name):
+    """生成省份的组播IP表：类型列按config.area_priority中的地区，前 --dead-hosts 个可用IP解析到无法连接的端口"""
+    args = state.args
+    areas = config.area_priority.get(province_name) or DEFAULT_AREAS
+    province_index = sorted(state.provinces_mapping.values()).index(province_value) + 1
+    entries = []
+    dead_left = args.dead_hosts
+    for index in range(args.hosts):
+        status = "暂时失效" if index % 5 == 4 else "正常"
+        if status == "正常" and dead_left > 0:
+            dead_left -= 1
+            port = get_free_port()
+        else:
+            port = start_server(StreamHandler, state)
+        entries.append({
+            "ip": f"10.{province_index}.{index + 1}.1",
+            "status": status,
+            "type": f"{province_name}{areas[index % len(areas)]}电信",
+            "port": port,
+        })
+    return entries
+
+
+def start_replay(args):
+    """启动替身站点和替身udpxy主机，返回共享状态（base_url为站点地址）"""
+    import main
+
+    state = ReplayState(args)
+    state.provinces_mapping = dict(main.PROVINCE_MAPPING)
+    template_channels = main.parse_template(os.path.join(REPO_DIR, "demo.txt"))
+    state.template_channel_names = [name for channel_list in template_channels.values() for name in channel_list]
+
+    def get_province(province_value):
+        with state.lock:
+            if province_value not in state.provinces:
+                province_name = main.VALUE_TO_PROVINCE.get(province_value)
+                if province_name is None:
+                    return []
+                state.provinces[province_value] = build_province_entries(state, province_value, province_name)
+            return state.provinces[province_value]
+
+    state.get_province = get_province
+    state.hotel_host = start_server(StreamHandler, state)
+    state.base_url = f"http://127.0.0.1:{start_server(SiteHandler, state)}"
+    return state
+
+
+def get_config_overrides(state, args):
+    """指向替身服务需要覆盖的config项"""
+    base_url = state.base_url
+    overrides = {
+        "site_base_url": base_url,
+        "multicast_channels_url": base_url + "/?s={ip_port}&t=multicast&channels=1&format=txt",
+        "source_urls": [f"{base_url}/?s=127.0.0.1%3A{state.hotel_host}&t=hotel&channels=1&format=txt"],
+        "logo_url_template": base_url + "/logos/{channel_name}.png",
+        "logo_mirror_dir": None,
+        "epg_urls": [f"{base_url}/e.xml"],
+        "epg_public_url": None,
+        "browser_cdp_endpoint": None,
+    }
+    if args.probe:
+        overrides["probe_enabled"] = True
+    return overrides
+
+
+def seed_multicast_cache(state, provinces):
+    """--skip-browser：把各省份可用的替身IP写入组播IP解析缓存，使get_all_source_urls跳过浏览器阶段"""
+    import main
+
+    for province in provinces:
+        province_value, province_name = main.validate_province(province)
+        entries = [entry for entry in state.get_province(province_value) if entry["status"] == "正常"]
+        ip_details = [
+            main.make_ip_detail(rank, {"ip_address": entry["ip"], "status": entry["status"], "type": entry["type"]},
+                                f"127.0.0.1:{entry['port']}", f"{state.base_url}/?ip={entry['ip']}&p={province_value}")
+            for rank, entry in enumerate(entries, 1)
+        ]
+        main.update_multicast_cache(province_value, ip_details)
+
+
+def get_main_provinces(main_args):
+    """main.py参数对应的省份（用于--skip-browser预写缓存）"""
+    if not main_args:
+        return ["海南"]
+    if main_args[0] == "--batch":
+        return main_args[1:] or config.batch_provinces
+    if main_args[0] in ("--static", "--epg"):
+        return []
+    return [main_args[0]]
+
+
+def run_main_flow(main_args):
+    """以 __main__ 方式运行main.py（与命令行运行相同的流程），返回耗时"""
+    saved_argv = sys.argv
+    sys.argv = [os.path.join(REPO_DIR, "main.py")] + list(main_args)
+    start_time = time.perf_counter()
+    try:
+        runpy.run_path(sys.argv[0], run_name="__main__")
+    except SystemExit:
+        pass
+    finally:
+        sys.argv = saved_argv
+    return time.perf_counter() - start_time
+
+
+def summarize_outputs(workdir):
+    summary = []
+    for file_name in sorted(os.listdir(workdir)):
+        if file_name.startswith("live") and file_name.endswith((".m3u", ".txt")):
+            with open(os.path.join(workdir, file_name), "r", encoding="utf-8") as f:
+                line_count = sum(1 for line in f if "://" in line)
+            summary.append(f"{file_name}（{line_count}条链接）")
+    return "、".join(summary) or "无"
+
+
+def run_replay(args, main_args):
+    """在临时工作目录中对替身服务运行main.py --runs次（首次冷启动，之后复用缓存）"""
+    state = start_replay(args)
+    overrides = get_config_overrides(state, args)
+    for key, value in overrides.items():
+        setattr(config, key, value)
+    os.environ.pop("GITHUB_OUTPUT", None)
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="iptv_replay_")
+    os.makedirs(workdir, exist_ok=True)
+    shutil.copy(os.path.join(REPO_DIR, "demo.txt"), workdir)
+    saved_cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        if args.skip_browser:
+            seed_multicast_cache(state, get_main_provinces(main_args))
+        print(f"替身站点：{state.base_url}，工作目录：{workdir}，main.py参数：{main_args or '（默认）'}")
+        for run_index in range(1, args.runs + 1):
+            state.route_counts.clear()
+            elapsed = run_main_flow(main_args)
+            routes = "，".join(f"{route}×{count}" for route, count in sorted(state.route_counts.items()))
+            print(f"第{run_index}次运行：{elapsed:.2f}秒 | 输出：{summarize_outputs(workdir)} | 请求：{routes or '无'}")
+    finally:
+        os.chdir(saved_cwd)
+        for server in state.servers:
+            server.shutdown()
+    print(f"日志：{os.path.join(workdir, 'function.log')}")
+
+
+def serve_forever(args):
+    state = start_replay(args)
+    print(f"替身站点：{state.base_url}（Ctrl+C 退出）")
+    print("在config.py中覆盖以下配置项：")
+    for key, value in get_config_overrides(state, args).items():
+        print(f"    {key} = {value!r}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+
+
+def run_probe_check(args):
+    """对各种替身主机运行main的线路探测，校验可用/不可用判断，返回退出码"""
+    import main
+
+    def start_stream_host(stream_mode):
+        mode_args = copy.copy(args)
+        mode_args.stream_mode = stream_mode
+        mode_args.stream_failure_rate = 0.0
+        state = ReplayState(mode_args)
+        return state, start_server(StreamHandler, state)
+
+    hosts = {stream_mode: start_stream_host(stream_mode) for stream_mode in ("ts", "chunked", "html")}
+    cases = [
+        ("TS流", f"http://127.0.0.1:{hosts['ts'][1]}/rtp/239.1.1.1:5140", True),
+        ("分块传输的TS流", f"http://127.0.0.1:{hosts['chunked'][1]}/rtp/239.1.1.2:5140", True),
+        ("认证门户页（200 text/html）", f"http://127.0.0.1:{hosts['html'][1]}/rtp/239.1.1.3:5140", False),
+        ("404", f"http://127.0.0.1:{hosts['ts'][1]}/status", False),
+        ("无法连接", f"http://127.0.0.1:{get_free_port()}/rtp/239.1.1.4:5140", False),
+    ]
+    try:
+        results = asyncio.run(main.probe_stream_urls([url for _, url, _ in cases]))
+    finally:
+        for state, _ in hosts.values():
+            for server in state.servers:
+                server.shutdown()
+
+    failures = 0
+    for case_name, url, expected in cases:
+        result = results[url]
+        passed = result["ok"] is expected
+        failures += not passed
+        print(f"{'通过' if passed else '失败'}  {case_name}：期望{'可用' if expected else '不可用'}，"
+              f"结果：ok={result['ok']}，吞吐量 {result['throughput'] / 1024:.0f}KB/s")
+    print(f"线路探测校验：{len(cases) - failures}/{len(cases)}项通过")
+    return 1 if failures else 0
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="离线回放：本地替身站点和udpxy主机")
+    parser.add_argument("command", choices=["serve", "run", "probe-check"])
+    parser.add_argument("--record-dir", help="录制的页面和频道列表所在目录")
+    parser.add_argument("--hosts", type=int, default=8, help="每个省份的组播IP数")
+    parser.add_argument("--dead-hosts", type=int, default=2, help="解析到无法连接端口的组播IP数")
+    parser.add_argument("--delay", type=float, default=0.0, help="站点页面响应延迟（秒）")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="站点页面返回503的比例")
+    parser.add_argument("--stream-delay", type=float, default=0.0, help="TS流首字节延迟（秒）")
+    parser.add_argument("--stream-failure-rate", type=float, default=0.0, help="TS流返回503的比例")
+    parser.add_argument("--stream-rate", type=float, default=0.0, help="TS流每秒字节数（0不限速）")
+    parser.add_argument("--stream-bytes", type=int, default=1024 * 1024, help="每次TS流输出的总字节数")
+    parser.add_argument("--stream-mode", choices=["ts", "chunked", "html"], default="ts", help="替身udpxy主机的响应方式")
+    parser.add_argument("--seed", type=int, default=0, help="失败注入的随机种子")
+    parser.add_argument("--runs", type=int, default=1, help="run：连续运行次数（首次冷启动，之后复用缓存）")
+    parser.add_argument("--workdir", help="run：工作目录（默认新建临时目录）")
+    parser.add_argument("--skip-browser", action="store_true", help="run：预写组播IP解析缓存，跳过浏览器阶段")
+    parser.add_argument("--probe", action="store_true", help="开启线路探测")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    argv = sys.argv[1:]
+    main_args = []
+    if "--" in argv:
+        main_args = argv[argv.index("--") + 1:]
+        argv = argv[:argv.index("--")]
+    replay_args = parse_args(argv)
+    if replay_args.command == "serve":
+        serve_forever(replay_args)
+    elif replay_args.command == "probe-check":
+        sys.exit(run_probe_check(replay_args))
+    else:
+        run_replay(replay_args, main_args)